@@ -0,0 +1,283 @@
+# Benchmarks of the algorithms of minimization, pda, cfg_simp and
+# greibach.
+
+# Each benchmark runs an algorithm on inputs of increasing size from a
+# generator in generators.py and records, per size, the best and
+# median time of several runs and the peak memory of one more run,
+# traced by tracemalloc. The results are written as JSON, with an
+# estimate of the exponent of the growth of the time with the size,
+# and can be compared with the results of another commit:
+
+#   python benchmark.py --output new.json --compare old.json
+
+import os
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for d in ["minimization", "pda", "cfg_simp", "greibach"]:
+    sys.path.append(os.path.join(root, d))
+
+import min as minimization
+import pda
+import cfg_simp
+import cyk
+import greibach
+from generators import (random_dfa, chain_dfa, redundant_dfa, random_pda, epsilon_pda,
+                        random_word, random_cfg, random_cnf, nullable_cfg, left_recursive_cfg,
+                        unit_chain_cfg)
+
+# Setups build the arguments of an algorithm outside of the timed
+# region, and are called before every run, since some algorithms
+# update their arguments.
+
+def table_setup(gen):
+    def setup(n, seed):
+        states, sigma, delta, final = gen(n, seed=seed)
+        state_pairs = minimization.make_state_pairs(states)
+        return sigma, delta, state_pairs, [True] * len(state_pairs), final
+    return setup
+
+def dfa_setup(gen):
+    def setup(n, seed):
+        _, sigma, delta, final = gen(n, seed=seed)
+        return sigma, delta, final
+    return setup
+
+def pda_setup(gen, states, word_length):
+    # The size is the length of the word for random PDAs, and the
+    # parameter of the family otherwise.
+    def setup(n, seed):
+        if gen is random_pda:
+            t_dict, q0, final = gen(states, seed=seed)
+            w = random_word(n, seed=seed)
+        else:
+            t_dict, q0, final = gen(n, seed=seed)
+            w = random_word(word_length, k=1, seed=seed)
+        return w, q0, final, t_dict
+    return setup
+
+def cfg_setup(gen, **kwargs):
+    def setup(n, seed):
+        v, p, s = gen(n, seed=seed, **kwargs)
+        return v, p, s
+    return setup
+
+def run_table(sigma, delta, state_pairs, equiv_states, final):
+    minimization.min(sigma, delta, state_pairs, equiv_states, final)
+
+def run_lifted(w, q0, final, t_dict):
+    pda.lifted_delta_clos([(w, q0, [])], t_dict)
+
+def run_lifted_compiled(w, q0, final, t_dict):
+    pda.lifted_delta_clos([(w, q0, [])], pda.compile_pda(t_dict))
+
+def accepts_run(max_stack_depth=None):
+    # The stack depth is bounded by max_stack_depth, by default
+    # 2 * len(w) + 8. The configurations of random PDAs grow
+    # exponentially with the bound, so they get a constant one.
+    def run(w, q0, final, t_dict):
+        depth = 2 * len(w) + 8 if max_stack_depth is None else max_stack_depth
+        pda.accepts(w, q0, final, t_dict, max_stack_depth=depth)
+    return run
+
+def run_generate_terminals(v, p, s):
+    t = { x for a in p for alpha in p[a] for x in alpha if x not in p }
+    cfg_simp.vars_that_generate_terminals(t, p)
+
+def run_nullable(v, p, s):
+    cfg_simp.comp_empty_word_var_set(p, set(v))
+
+def run_excl_empty(v, p, s):
+    ve = cfg_simp.comp_empty_word_var_set(p, set(v))
+    cfg_simp.excl_empty_prod(p, ve)
+
+def run_unit_closure(v, p, s):
+    cfg_simp.comp_unit_closure(p, set(v))
+
+def cyk_setup(sentences, length):
+    # The size is the number of variables of the grammar.
+    def setup(n, seed):
+        v, p, s = random_cnf(n, seed=seed)
+        words = [random_word(length, seed=seed + i) for i in range(sentences)]
+        return cyk.compile_cnf(p, s), [list(w) for w in words]
+    return setup
+
+def run_cyk_many(g, sentences):
+    cyk.cyk_many(g, sentences)
+
+def run_r_lte_s(v, p, s):
+    # Random grammars may have exponentially large results for some
+    # orders; such runs stop at 10^5 productions.
+    greibach.r_lte_s(v, p, 10 ** 5)
+
+def run_to_gnf(v, p, s):
+    # The whole pipeline, which interns the grammar once.
+    greibach.to_gnf(v, p, 10 ** 5)
+
+# Each benchmark is (name, family, default sizes, setup, run).
+
+BENCHMARKS = [
+    ("min.table", "random_dfa", [250, 500, 1000, 2000], table_setup(random_dfa), run_table),
+    ("min.table", "chain_dfa", [250, 500, 1000, 2000], table_setup(chain_dfa), run_table),
+    ("min.table_classes", "chain_dfa", [1000, 2000, 4000, 8000],
+     dfa_setup(chain_dfa), lambda sigma, delta, final:
+         minimization.table_classes(minimization.make_compact_dfa(sigma, delta, final))),
+    ("min.hopcroft", "random_dfa", [1000, 4000, 16000, 64000],
+     dfa_setup(random_dfa), minimization.hopcroft),
+    ("min.hopcroft", "chain_dfa", [1000, 4000, 16000, 64000],
+     dfa_setup(chain_dfa), minimization.hopcroft),
+    ("min.hopcroft", "redundant_dfa", [1000, 4000, 16000, 64000],
+     dfa_setup(redundant_dfa), minimization.hopcroft),
+    ("min.moore", "random_dfa", [1000, 4000, 16000, 64000],
+     dfa_setup(random_dfa), lambda sigma, delta, final:
+         minimization.moore_classes(minimization.make_compact_dfa(sigma, delta, final))),
+    ("pda.lifted_delta_clos", "random_pda", [4, 6, 8, 10],
+     pda_setup(random_pda, 8, None), run_lifted),
+    ("pda.lifted_delta_clos", "epsilon_pda", [2, 4, 6, 8],
+     pda_setup(epsilon_pda, None, 2), run_lifted),
+    ("pda.lifted_delta_clos.compiled", "random_pda", [4, 6, 8, 10],
+     pda_setup(random_pda, 8, None), run_lifted_compiled),
+    ("pda.lifted_delta_clos.compiled", "epsilon_pda", [2, 4, 6, 8],
+     pda_setup(epsilon_pda, None, 2), run_lifted_compiled),
+    ("pda.accepts", "random_pda", [16, 32, 64, 128],
+     pda_setup(random_pda, 8, None), accepts_run(8)),
+    ("pda.accepts", "epsilon_pda", [8, 16, 32, 64],
+     pda_setup(epsilon_pda, None, 8), accepts_run()),
+    ("cfg_simp.vars_that_generate_terminals", "random_cfg", [1000, 4000, 16000, 64000],
+     cfg_setup(random_cfg), run_generate_terminals),
+    ("cfg_simp.comp_empty_word_var_set", "nullable_cfg", [1000, 4000, 16000, 64000],
+     cfg_setup(nullable_cfg), run_nullable),
+    ("cfg_simp.excl_empty_prod", "nullable_cfg", [1000, 4000, 16000],
+     cfg_setup(nullable_cfg), run_excl_empty),
+    ("cfg_simp.excl_empty_prod", "random_cfg", [1000, 4000, 16000],
+     cfg_setup(random_cfg, epsilon_ratio=0.5), run_excl_empty),
+    ("cfg_simp.comp_unit_closure", "unit_chain_cfg", [250, 500, 1000, 2000],
+     cfg_setup(unit_chain_cfg), run_unit_closure),
+    ("cyk.cyk_many", "random_cnf", [25, 50, 100, 200],
+     cyk_setup(1000, 20), run_cyk_many),
+    ("greibach.r_lte_s", "left_recursive_cfg", [100, 200, 400, 800, 1600],
+     cfg_setup(left_recursive_cfg), run_r_lte_s),
+    ("greibach.r_lte_s", "random_cfg", [10, 20, 40, 80],
+     cfg_setup(random_cfg, epsilon_ratio=0), run_r_lte_s),
+    ("greibach.to_gnf", "left_recursive_cfg", [25, 50, 100, 200],
+     cfg_setup(left_recursive_cfg), run_to_gnf),
+    ("greibach.to_gnf", "random_cfg", [10, 20, 40, 80],
+     cfg_setup(random_cfg, epsilon_ratio=0), run_to_gnf),
+]
+
+def measure(setup, run, n, seed, repeat, memory=True):
+    '''
+    Runs run on the arguments built by setup(n, seed) repeat times.
+    Returns the best and median times, in seconds, and the peak memory
+    allocated by one more run, in bytes, or None if memory is false.
+    '''
+    times = []
+    for _ in range(repeat):
+        args = setup(n, seed)
+        start = time.perf_counter()
+        run(*args)
+        times.append(time.perf_counter() - start)
+    peak = None
+    if memory:
+        args = setup(n, seed)
+        tracemalloc.start()
+        run(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return min(times), statistics.median(times), peak
+
+def scaling_exponent(points):
+    '''
+    Least squares slope of log(time) over log(size), that is, the
+    exponent k of a time growing as size^k.
+    '''
+    points = [(math.log(n), math.log(t)) for n, t in points if t > 0]
+    if len(points) < 2:
+        return None
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mx) ** 2 for x, _ in points)
+    if sxx == 0:
+        return None
+    return sum((x - mx) * (y - my) for x, y in points) / sxx
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(only=None, repeat=3, seed=0, scale=1.0, max_seconds=10.0, memory=True):
+    '''
+    Runs the benchmarks whose name or family contains only, over their
+    sizes multiplied by scale. The sweep of a benchmark stops after a
+    size whose best time exceeds max_seconds.
+    Returns the results as a dictionary ready to be written as JSON.
+    '''
+    results = []
+    scaling = []
+    for name, family, sizes, setup, run in BENCHMARKS:
+        if only is not None and only not in name and only not in family:
+            continue
+        points = []
+        # Scaled sizes may coincide, which would repeat points.
+        for n in sorted({ max(1, int(n * scale)) for n in sizes }):
+            best, median, peak = measure(setup, run, n, seed, repeat, memory)
+            print(name, family, n, "%.6f" % best, "s", "" if peak is None else str(peak) + " B",
+                  flush=True)
+            results.append({ "benchmark" : name, "family" : family, "size" : n,
+                             "best" : best, "median" : median, "peak_bytes" : peak })
+            points.append((n, best))
+            if best > max_seconds:
+                break
+        scaling.append({ "benchmark" : name, "family" : family,
+                         "exponent" : scaling_exponent(points) })
+    meta = { "commit" : git_commit(), "python" : platform.python_version(),
+             "machine" : platform.machine(), "date" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+             "seed" : seed, "repeat" : repeat, "scale" : scale }
+    return { "meta" : meta, "results" : results, "scaling" : scaling }
+
+def compare(old, new):
+    '''
+    Prints the ratio of the best times in old and new, which are
+    results of run_benchmarks, for the runs that are in both.
+    '''
+    old_best = { (r["benchmark"], r["family"], r["size"]) : r["best"] for r in old["results"] }
+    print("Comparison with commit", old["meta"].get("commit"))
+    for r in new["results"]:
+        key = (r["benchmark"], r["family"], r["size"])
+        if key in old_best and r["best"] > 0:
+            print(*key, "%.6f" % old_best[key], "→", "%.6f" % r["best"],
+                  "(%.2fx)" % (old_best[key] / r["best"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the formal languages algorithms.")
+    parser.add_argument("--only", help="run only the benchmarks whose name or family contains ONLY")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per size")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generators")
+    parser.add_argument("--scale", type=float, default=1.0, help="factor applied to the sizes")
+    parser.add_argument("--max-seconds", type=float, default=10.0,
+                        help="stop a sweep after a size slower than this")
+    parser.add_argument("--no-memory", action="store_true", help="do not trace peak memory")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file of the results")
+    parser.add_argument("--compare", help="JSON file of previous results to compare with")
+    args = parser.parse_args()
+    results = run_benchmarks(args.only, args.repeat, args.seed, args.scale,
+                             args.max_seconds, not args.no_memory)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    for s in results["scaling"]:
+        if s["exponent"] is not None:
+            print(s["benchmark"], s["family"], "time ~ size^%.2f" % s["exponent"])
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
@@ -0,0 +1,192 @@
+# Seeded generators of automata and grammars for the benchmarks.
+
+# Every generator takes a size and a seed and returns its object in the
+# representation of the corresponding module:
+
+# - DFA: (states, sigma, delta, final), as in minimization/min.py, with
+#   a total transition function;
+# - PDA: (t_dict, q0, final), as in pda/pda.py;
+# - CFG: (v, p, s), as in cfg_simp and greibach, where p is the
+#   production dictionary.
+
+# The random generators have a configurable shape; the other ones are
+# pathological families for particular algorithms.
+
+import random
+
+# DFAs
+
+def random_dfa(n, k=2, final_ratio=0.5, seed=0):
+    '''
+    Total DFA with n states, k symbols and random transitions. Each
+    state is final with probability final_ratio.
+    '''
+    rng = random.Random(seed)
+    states = ["q" + str(i) for i in range(n)]
+    sigma = set(range(k))
+    delta = { q : { a : rng.choice(states) for a in range(k) } for q in states }
+    final = [q for q in states if rng.random() < final_ratio]
+    return states, sigma, delta, final
+
+def chain_dfa(n, k=2, seed=0):
+    '''
+    DFA whose states form a chain q0 → q1 → ... → q(n-1) on symbol 0,
+    with the last state final and the other symbols back to q0. No two
+    states are equivalent, and the table-filling algorithm needs n - 1
+    rounds of propagation to tell the first states apart.
+    '''
+    states = ["q" + str(i) for i in range(n)]
+    sigma = set(range(k))
+    delta = {}
+    for i, q in enumerate(states):
+        delta[q] = { a : "q0" for a in range(1, k) }
+        delta[q][0] = states[min(i + 1, n - 1)]
+    return states, sigma, delta, [states[-1]]
+
+def redundant_dfa(n, k=2, classes=4, seed=0):
+    '''
+    DFA with n states that collapse into at most classes states: each
+    state copies the behaviour of a random state of a small random DFA,
+    of min(classes, n) states, so that each of them has a copy.
+    '''
+    rng = random.Random(seed)
+    classes = min(classes, n)
+    _, _, small, small_final = random_dfa(classes, k, seed=seed)
+    small_states = list(small.keys())
+    states = ["q" + str(i) for i in range(n)]
+    origin = { q : small_states[i % classes] for i, q in enumerate(states) }
+    copies = {}
+    for q in states:
+        copies.setdefault(origin[q], []).append(q)
+    delta = { q : { a : rng.choice(copies[small[origin[q]][a]]) for a in range(k) }
+              for q in states }
+    final = [q for q in states if origin[q] in small_final]
+    return states, set(range(k)), delta, final
+
+# PDAs
+
+def random_pda(n, k=2, stack_symbols=2, moves=2, epsilon_ratio=0.3, seed=0):
+    '''
+    PDA with n states, input symbols "a", "b", ... (k of them) and
+    stack symbols "A", "B", ... Every state reads every input symbol
+    without looking at the stack, so that no run gets stuck, and has
+    moves more random transitions, a fraction epsilon_ratio of which
+    do not read the input. To keep the simulation finite, an epsilon
+    transition only goes to a state of greater number. Every state has
+    an end-of-input transition to "qf" with probability 1/2.
+    '''
+    rng = random.Random(seed)
+    states = ["q" + str(i) for i in range(n)]
+    inputs = [chr(ord("a") + i) for i in range(k)]
+    stack = [chr(ord("A") + i) for i in range(stack_symbols)]
+    t_dict = {}
+    for i, q in enumerate(states):
+        t_dict[q] = [(a, "epsilon", rng.choice(stack + ["epsilon"]), rng.choice(states))
+                     for a in inputs]
+        for _ in range(moves):
+            top = rng.choice(stack)
+            push = rng.choice(stack + ["epsilon"])
+            if rng.random() < epsilon_ratio and i < n - 1:
+                t_dict[q].append(("epsilon", top, push, rng.choice(states[i + 1:])))
+            else:
+                t_dict[q].append((rng.choice(inputs), top, push, rng.choice(states)))
+        if rng.random() < 0.5:
+            t_dict[q].append(("?", "?", "epsilon", "qf"))
+    return t_dict, "q0", {"qf"}
+
+def epsilon_pda(n, seed=0):
+    '''
+    PDA where each input symbol is followed by a ladder of n epsilon
+    steps, each of which either pushes A or pushes nothing, so that
+    every input symbol multiplies the configurations by up to n + 1
+    stack depths. The stack is popped down to empty at the end of the
+    ladder, when the input is consumed.
+    '''
+    t_dict = { "r" : [("a", "epsilon", "epsilon", "e0"), ("epsilon", "A", "epsilon", "r"),
+                      ("?", "?", "epsilon", "qf")] }
+    for i in range(n):
+        t_dict["e" + str(i)] = [("epsilon", "epsilon", "A", "e" + str(i + 1)),
+                                ("epsilon", "epsilon", "epsilon", "e" + str(i + 1))]
+    t_dict["e" + str(n)] = [("epsilon", "epsilon", "epsilon", "r")]
+    return t_dict, "r", {"qf"}
+
+def random_word(length, k=2, seed=0):
+    rng = random.Random(seed)
+    return "".join(rng.choice([chr(ord("a") + i) for i in range(k)]) for _ in range(length))
+
+# CFGs
+
+def random_cfg(n, k=2, rules=3, max_len=3, epsilon_ratio=0.1, seed=0):
+    '''
+    Grammar with variables V0, ..., V(n-1), start symbol V0 and
+    terminals "a", "b", ... (k of them). Each variable has up to rules
+    productions of length 1 to max_len, and an empty production with
+    probability epsilon_ratio.
+    '''
+    rng = random.Random(seed)
+    v = ["V" + str(i) for i in range(n)]
+    t = [chr(ord("a") + i) for i in range(k)]
+    p = {}
+    for a in v:
+        p[a] = []
+        for _ in range(rng.randint(1, rules)):
+            alpha = [rng.choice(v + t) for _ in range(rng.randint(1, max_len))]
+            if alpha not in p[a]:
+                p[a].append(alpha)
+        if rng.random() < epsilon_ratio:
+            p[a].append(["epsilon"])
+    return v, p, "V0"
+
+def random_cnf(n, k=2, rules=3, seed=0):
+    '''
+    Grammar in Chomsky normal form with variables V0, ..., V(n-1),
+    start symbol V0 and terminals "a", "b", ... (k of them). Each
+    variable has rules productions A → B C with random variables and
+    produces one random terminal.
+    '''
+    rng = random.Random(seed)
+    v = ["V" + str(i) for i in range(n)]
+    t = [chr(ord("a") + i) for i in range(k)]
+    p = {}
+    for a in v:
+        p[a] = [[rng.choice(t)]]
+        for _ in range(rules):
+            alpha = [rng.choice(v), rng.choice(v)]
+            if alpha not in p[a]:
+                p[a].append(alpha)
+    return v, p, "V0"
+
+def nullable_cfg(n, width=4, seed=0):
+    '''
+    Grammar where every variable is nullable: Vi → V(i+1) ... V(i+1) | a,
+    with width occurrences of V(i+1), and V(n-1) → a | epsilon. The
+    empty production elimination has 2^width variants per production,
+    and the nullable set is only found after n rounds of propagation.
+    '''
+    v = ["V" + str(i) for i in range(n)]
+    p = { v[i] : [[v[i + 1]] * width, ["a"]] for i in range(n - 1) }
+    p[v[-1]] = [["a"], ["epsilon"]]
+    return v, p, "V0"
+
+def left_recursive_cfg(n, seed=0):
+    '''
+    Grammar without empty productions where each variable begins a RHS
+    of the previous one, closing a cycle of leading variables:
+    Vi → V(i+1) a | b Vi, where V(n) is V0, and V(n-1) → b. Every
+    order of the variables needs substitutions in the GNF
+    transformation.
+    '''
+    v = ["V" + str(i) for i in range(n)]
+    p = { v[i] : [[v[(i + 1) % n], "a"], ["b", v[i]]] for i in range(n) }
+    p[v[-1]].append(["b"])
+    return v, p, "V0"
+
+def unit_chain_cfg(n, seed=0):
+    '''
+    Grammar with a cycle of unit productions V0 → V1 → ... → V(n-1) → V0
+    and two other productions per variable, whose unit closure has
+    n^2 pairs.
+    '''
+    v = ["V" + str(i) for i in range(n)]
+    p = { v[i] : [[v[(i + 1) % n]], ["a", v[i]], [chr(ord("a") + i % 26)]] for i in range(n) }
+    return v, p, "V0"
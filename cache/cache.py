@@ -0,0 +1,364 @@
+# On-disk cache of the results of the algorithms of minimization,
+# pda, cfg_simp and greibach, and of rendered automata.
+
+# Entries are keyed by the SHA-256 of a canonical JSON serialization of
+# the name of the computation, of the source of the modules that
+# compute it and of its inputs, so that a DFA, PDA or grammar is only
+# transformed once, whatever the order of its states, symbols or
+# variables in the dictionaries and sets that describe it, and entries
+# computed by older versions of the algorithms are not used. Inputs
+# are put in canonical order before they are transformed, so that the
+# results do not depend on that order either.
+
+# Each entry is a file named after its key, holding a header, a pickle
+# of the result and, after it, the raw contents of the arrays of the
+# result (array.array, bytearray and NumPy arrays), aligned to 8
+# bytes. Loading an entry memory-maps the file and the arrays become
+# read-only views of the map, so that large transition tables are
+# neither copied nor read from disk until they are used.
+
+# The cache is bounded in size: when its entries take more than
+# max_bytes, the least recently used ones are removed. Every hit
+# updates the modification time of the entry, which orders them.
+
+import io
+import os
+import sys
+import json
+import mmap
+import pickle
+import hashlib
+import tempfile
+from array import array
+import numpy as np
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for d in ["minimization", "pda", "cfg_simp", "greibach", "grammar"]:
+    sys.path.append(os.path.join(root, d))
+
+import min as minimization
+import pda
+import cfg_simp
+import greibach
+import grammar
+
+MAGIC = b"FLACACHE"
+VERSION = 1
+HEADER = 16
+MISSING = object()
+
+def canonical(x):
+    '''
+    Serializes x, built from dictionaries, lists, tuples, sets, strings,
+    bytes, numbers, booleans and None, as JSON text that only depends on
+    its content: containers are tagged with their type, and the items
+    of dictionaries and sets are sorted by their serialization.
+    '''
+    t = type(x)
+    if t is str:
+        return encode_string(x)
+    if t is int:
+        return str(x)
+    if x is None or t is bool or t is float:
+        return json.dumps(x)
+    if t is list or t is tuple:
+        return "[" + ",".join([json.dumps(t.__name__)] + [canonical(y) for y in x]) + "]"
+    if t is set or t is frozenset:
+        return "[" + ",".join(['"set"'] + sorted(canonical(y) for y in x)) + "]"
+    if t is dict:
+        items = sorted((canonical(k), canonical(v)) for k, v in x.items())
+        return "[" + ",".join(['"dict"'] + ["[" + k + "," + v + "]" for k, v in items]) + "]"
+    if t is bytes or t is bytearray:
+        return '["bytes","' + x.hex() + '"]'
+    raise Exception("Cannot serialize " + repr(x))
+
+encode_string = json.encoder.encode_basestring
+
+def content_key(name, *args):
+    '''
+    Key of the computation name on the inputs args: the hexadecimal
+    SHA-256 of their canonical serialization.
+    '''
+    text = "[" + str(VERSION) + "," + encode_string(name) + "," + canonical(list(args)) + "]"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def canonical_order(d):
+    # Copy of the dictionary d with its keys in canonical order.
+    return dict(sorted(d.items(), key=lambda item: canonical(item[0])))
+
+def canonical_list(xs):
+    return sorted(xs, key=canonical)
+
+source_hashes = {}
+
+def source_hash(modules):
+    '''
+    Hexadecimal SHA-256 of the source files of modules, computed once
+    per run.
+    '''
+    names = tuple(m.__name__ for m in modules)
+    if names not in source_hashes:
+        h = hashlib.sha256()
+        for m in modules:
+            with open(m.__file__, "rb") as f:
+                h.update(f.read())
+        source_hashes[names] = h.hexdigest()
+    return source_hashes[names]
+
+def align(n):
+    return (n + 7) & ~7
+
+class EntryPickler(pickle.Pickler):
+    '''
+    Pickler that leaves the contents of arrays out of the pickle, in
+    payloads, and pickles their offsets in the payload region instead.
+    '''
+    def __init__(self, f):
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.payloads = []
+        self.size = 0
+
+    def add_payload(self, data):
+        offset = self.size
+        self.payloads.append((offset, data))
+        self.size = align(offset + len(data))
+        return offset
+
+    def persistent_id(self, obj):
+        if type(obj) is array and obj.typecode != "u":
+            data = obj.tobytes()
+            return ("array", obj.typecode, self.add_payload(data), len(data))
+        if type(obj) is bytearray:
+            return ("array", "B", self.add_payload(bytes(obj)), len(obj))
+        if type(obj) is np.ndarray and not obj.dtype.hasobject:
+            data = np.ascontiguousarray(obj).tobytes()
+            return ("ndarray", obj.dtype.str, obj.shape, self.add_payload(data), len(data))
+        return None
+
+class EntryUnpickler(pickle.Unpickler):
+    '''
+    Unpickler that maps the arrays of an entry to views of the memory
+    map of its file, whose payload region starts at base.
+    '''
+    def __init__(self, f, view, base):
+        super().__init__(f)
+        self.view = view
+        self.base = base
+        self.mapped = False
+
+    def persistent_load(self, pid):
+        self.mapped = True
+        if pid[0] == "array":
+            _, typecode, offset, size = pid
+            start = self.base + offset
+            return self.view[start:start + size].cast(typecode)
+        _, dtype, shape, offset, size = pid
+        a = np.frombuffer(self.view, dtype=dtype, count=size // np.dtype(dtype).itemsize,
+                          offset=self.base + offset)
+        return a.reshape(shape)
+
+class Cache:
+    '''
+    Size-bounded cache of results in the directory path. Arrays of the
+    results it returns are read-only views of the entry files: arrays
+    from the array module and bytearrays become memoryviews of the same
+    type code, and NumPy arrays stay NumPy arrays.
+    '''
+    def __init__(self, path, max_bytes=1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key + ".bin")
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored under key, or default if there is none.
+        '''
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < HEADER:
+                    return default
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return default
+        if mm[:len(MAGIC)] != MAGIC:
+            mm.close()
+            return default
+        n = int.from_bytes(mm[len(MAGIC):HEADER], "little")
+        view = memoryview(mm)
+        unpickler = EntryUnpickler(io.BytesIO(view[HEADER:HEADER + n]), view, align(HEADER + n))
+        value = unpickler.load()
+        if not unpickler.mapped:
+            view.release()
+            mm.close()
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def put(self, key, value):
+        '''
+        Stores value under key, then evicts the least recently used
+        other entries if the cache exceeds its size. The new entry is
+        kept even if it is larger than the cache, so that a get right
+        after put finds it.
+        '''
+        buffer = io.BytesIO()
+        pickler = EntryPickler(buffer)
+        pickler.dump(value)
+        data = buffer.getvalue()
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(data).to_bytes(HEADER - len(MAGIC), "little"))
+            f.write(data)
+            base = align(HEADER + len(data))
+            f.write(bytes(base - HEADER - len(data)))
+            for offset, payload in pickler.payloads:
+                f.seek(base + offset)
+                f.write(payload)
+        os.replace(tmp, self.entry_path(key))
+        self.evict(keep=self.entry_path(key))
+
+    def evict(self, keep=None):
+        # Removes the least recently used entries but the one at path
+        # keep until the cache fits in max_bytes, or only keep is left.
+        entries = []
+        total = 0
+        with os.scandir(self.path) as it:
+            for e in it:
+                if e.name.endswith(".bin"):
+                    try:
+                        st = e.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, e.path))
+                    total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith(".bin"):
+                os.remove(os.path.join(self.path, name))
+
+    def cached(self, name, f, *args, modules=()):
+        '''
+        Returns f(*args), computed only if the result of the computation
+        name on args is not in the cache. The key includes the source of
+        the module of f and of modules, which must hold the code that f
+        calls. It is computed before f runs, since some algorithms update
+        their arguments.
+        '''
+        key = content_key(name, source_hash((sys.modules[f.__module__],) + tuple(modules)), *args)
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = f(*args)
+            self.put(key, value)
+        return value
+
+def default_cache():
+    '''
+    The cache in the directory given by the environment variable
+    FLA_CACHE_DIR, by default ~/.cache/fla, bounded by FLA_CACHE_BYTES
+    bytes, by default 1 GiB.
+    '''
+    path = os.environ.get("FLA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "fla"))
+    return Cache(path, int(os.environ.get("FLA_CACHE_BYTES", 1 << 30)))
+
+# Cached computations
+
+def minimized_compact_dfa(cache, sigma, delta, final):
+    '''
+    Minimizes the automaton with Hopcroft's algorithm. Returns the
+    minimized automaton as a CompactDFA whose states are the classes of
+    the states of the original one. Its table and final flags are
+    read-only memoryviews, memory-mapped when read from the cache, so
+    that the result behaves the same on a hit and on a miss.
+    '''
+    def minimize(sigma, delta, final):
+        cdfa = minimization.make_compact_dfa(sigma, delta, final)
+        class_of, n_classes = minimization.hopcroft_classes(cdfa)
+        return minimization.compact_quotient(cdfa, class_of, n_classes)
+    cdfa = cache.cached("min.hopcroft", minimize, canonical_list(sigma), canonical_order(delta),
+                        canonical_list(final), modules=[minimization])
+    cdfa.table = read_only(cdfa.table)
+    cdfa.final = read_only(cdfa.final)
+    return cdfa
+
+def read_only(a):
+    # A read-only memoryview of the array a, which may already be one.
+    return a if isinstance(a, memoryview) else memoryview(a).toreadonly()
+
+def minimized_dfa(cache, sigma, delta, final):
+    '''
+    Cached version of hopcroft_min: returns the partition of the states
+    and the transition function of the minimized automaton.
+    '''
+    min_cdfa = minimized_compact_dfa(cache, sigma, delta, final)
+    _, new_delta, _ = minimization.compact_to_dfa(min_cdfa)
+    return min_cdfa.states, new_delta
+
+def compiled_pda(cache, t_dict):
+    return cache.cached("pda.compile_pda", pda.compile_pda, canonical_order(t_dict))
+
+def simplified_grammar(cache, p, s):
+    '''
+    Simplifies the grammar with productions p and start symbol s: removes
+    its empty productions, its unit productions and its useless
+    symbols, in this order, and adds the empty production to s if s
+    generates the empty word. Returns the new productions.
+    '''
+    def simplify(p, s):
+        p = { a : [list(alpha) for alpha in p[a]] for a in p }
+        v = set(p)
+        ve = cfg_simp.comp_empty_word_var_set(p, v)
+        p1 = cfg_simp.excl_empty_prod(p, ve)
+        p1 = cfg_simp.remove_prod_replace_var(p1, v, cfg_simp.comp_unit_closure(p1, v))
+        t = { x for a in p1 for alpha in p1[a] for x in alpha if x not in v }
+        v1, p1 = cfg_simp.vars_that_generate_terminals(t, p1)
+        p1 = cfg_simp.comp_reachable_symbols(v1, p1, t, s)
+        if s in ve:
+            p1.setdefault(s, []).append(["epsilon"])
+        return p1
+    return cache.cached("cfg_simp.simplify", simplify, canonical_order(p), s, modules=[cfg_simp])
+
+def gnf(cache, v, p, limit=None):
+    '''
+    Cached version of greibach.to_gnf.
+    '''
+    return cache.cached("greibach.to_gnf", greibach.to_gnf, list(v), canonical_order(p), limit,
+                        modules=[cfg_simp, grammar])
+
+def render(cache, graph, filename):
+    '''
+    Renders the graphviz graph as graph.render(filename) does, writing
+    its DOT source to filename and its image next to it, but runs
+    Graphviz only if an image of the same source, format and engine is
+    not in the cache. Returns the path of the image.
+    '''
+    key = content_key("graphviz.render", graph.source, graph.format, graph.engine)
+    image = cache.get(key)
+    if image is None:
+        out = graph.render(filename)
+        with open(out, "rb") as f:
+            cache.put(key, f.read())
+        return out
+    graph.save(filename)
+    out = filename + "." + graph.format
+    with open(out, "wb") as f:
+        f.write(image)
+    return out
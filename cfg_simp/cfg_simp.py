@@ -12,40 +12,44 @@
 
 import pprint
 import copy
+import itertools
 
 # Useless symbols simplification
 
 def vars_that_generate_terminals(t, p):
+    '''
+    Computes the set of variables that generate words of terminals and
+    removes from p the productions with symbols that do not.
+    '''
+    # Worklist algorithm: each production counts the occurrences of its
+    # symbols not yet known to generate terminals, and uses indexes the
+    # productions by the symbols that occur in them. A variable is added
+    # when the count of one of its productions drops to zero.
+    rules = [(a, alpha) for a in p for alpha in p[a]]
+    count = []
+    uses = {}
     v1 = set()
-    while True:
-        size = len(v1)
-        for a in p:
-            for alpha in p[a]:
-                add_a = True
-                for x in alpha:
-                    if x in t or x in v1:
-                        continue
-                    else:
-                        add_a = False
-                        break
-                if add_a == False:
-                    continue
-                else:
-                    v1 = v1.union(set(a))
-        new_size = len(v1)
-        if size == new_size:
-            break
+    work = []
+    for r, (a, alpha) in enumerate(rules):
+        n = 0
+        for x in alpha:
+            if x not in t:
+                n += 1
+                uses.setdefault(x, []).append(r)
+        count.append(n)
+        if n == 0 and a not in v1:
+            v1.add(a)
+            work.append(a)
+    while work:
+        x = work.pop()
+        for r in uses.get(x, ()):
+            count[r] -= 1
+            a = rules[r][0]
+            if count[r] == 0 and a not in v1:
+                v1.add(a)
+                work.append(a)
     for a in p:
-        for alpha in p[a]:
-            add_alpha = True
-            for x in alpha:
-                if x in t or x in v1:
-                    continue
-                else:
-                    add_alpha = False
-                    break
-            if not add_alpha:
-                p[a].remove(alpha)
+        p[a][:] = [alpha for alpha in p[a] if all(x in t or x in v1 for x in alpha)]
     return v1, p
 
 def comp_reachable_symbols(v, p, t, s):
@@ -56,40 +60,27 @@ def comp_reachable_symbols(v, p, t, s):
     # vars_that_generate_terminals(t, p).
 
     # First we compute the sets of useful symbols either variable or
-    # teminal.
+    # teminal, visiting each variable once from s.
     t2 = set()
-    v2 = set(s)
-    while True:
-        size_t2 = len(t2)
-        size_v2 = len(v2)
-        for x in v2:
-            for alpha in p[x]:
-                for a in alpha:
-                    if a in v:
-                        v2 = v2.union(set(a))
-                    elif a in t:
-                        t2 = t2.union(set(a))
-        new_size_t2 = len(t2)
-        new_size_v2 = len(v2)
-        if size_t2 == new_size_t2 and size_v2 == new_size_v2:
-            break
+    v2 = {s}
+    work = [s]
+    while work:
+        x = work.pop()
+        for alpha in p.get(x, []):
+            for a in alpha:
+                if a in v:
+                    if a not in v2:
+                        v2.add(a)
+                        work.append(a)
+                elif a in t:
+                    t2.add(a)
 
     # Next we eliminate from p those productions that do not refer to
     # symbols in either v2 or t2.
     p2 = {}
     for a in p:
         if a in v2:
-            p2.update({a : []})
-        for alpha in p[a]:
-            alpha_is_good = True
-            for x in alpha:
-                if x in v2 or x in t2:
-                    continue
-                else:
-                    alpha_is_good = False
-                    break
-            if alpha_is_good:
-                p2[a].append(alpha)
+            p2[a] = [alpha for alpha in p[a] if all(x in v2 or x in t2 for x in alpha)]
     return p2
 
 # Empty production simplification
@@ -100,49 +91,95 @@ def comp_empty_word_var_set(p, v_set):
     generate the empty word.
     '''
     # ve is the initial set of variables that directly
-    # generate epsilon.
-    ve = { a for a in p if ["epsilon"] in p[a] } 
-    while True:
-        size_ve = len(ve)
-        for a in p:
-            for alpha in [w for w in p[a] if w != ["epsilon"]]:
-                nullable = True
-                for x in alpha:
-                    if x not in ve and x in v_set:
-                        nullable = False
-                        break
-                if nullable:
-                    ve = ve.union(set(a)) 
-        new_size_ve = len(ve)
-        if size_ve == new_size_ve:
-            break
+    # generate epsilon. A production whose symbols are all in ve adds
+    # its LHS to ve; each production counts its symbols not yet in ve,
+    # and uses indexes the productions by the variables in them.
+    ve = { a for a in p if ["epsilon"] in p[a] }
+    rules = [(a, alpha) for a in p for alpha in p[a] if alpha != ["epsilon"]]
+    count = []
+    uses = {}
+    for r, (a, alpha) in enumerate(rules):
+        count.append(len(alpha))
+        for x in alpha:
+            if x in v_set:
+                uses.setdefault(x, []).append(r)
+    work = list(ve)
+    while work:
+        x = work.pop()
+        for r in uses.get(x, ()):
+            count[r] -= 1
+            a = rules[r][0]
+            if count[r] == 0 and a not in ve:
+                ve.add(a)
+                work.append(a)
     return ve
 
-def excl_empty_prod(p, ve):
+def fresh_var(name, used):
+    '''
+    Returns name, primed as many times as needed for it not to be in
+    used, and adds it to used.
+    '''
+    while name in used:
+        name += "'"
+    used.add(name)
+    return name
+
+def drop_nullable(alpha, nullable):
+    '''
+    Yields, without repetitions, the non-empty words obtained from
+    alpha by removing any subset of the occurrences of symbols in
+    nullable, starting with alpha itself.
+    '''
+    choices = [((x,), ()) if x in nullable else ((x,),) for x in alpha]
+    seen = set()
+    for parts in itertools.product(*choices):
+        beta = tuple(x for part in parts for x in part)
+        if beta != () and beta not in seen:
+            seen.add(beta)
+            yield beta
+
+def excl_empty_prod(p, ve, budget=None):
     '''
     Removes (direct and indirect) empty productions.
+    Each production is expanded once into its variants without
+    nullable symbols. If budget is given, a production with more than
+    budget nullable symbols is first factored into a chain of new
+    variables with two symbols per RHS, so that it yields a number of
+    productions linear in its length instead of 2^k.
     '''
-    p1 = { a : [] for a in p }
+    # New variables must differ from the variables and the terminals.
+    used = set(p.keys()) | { x for a in p for alpha in p[a] for x in alpha }
+    p1 = {}
     for a in p:
+        rhs = {}
         for alpha in p[a]:
-           if alpha != ["epsilon"]:
-               p1[a].append(alpha)
+            if alpha == ["epsilon"]:
+                continue
+            k = sum(1 for x in alpha if x in ve)
+            if budget is None or k <= budget or len(alpha) <= 2:
+                for beta in drop_nullable(alpha, ve):
+                    rhs[beta] = None
+                continue
+            # A → X1 H1, H1 → X2 H2, ..., H_(n-2) → X_(n-1) X_n, where
+            # H_i is nullable when X_(i+1) ... X_n all are.
+            helpers = [fresh_var(a + "_e", used) for _ in range(len(alpha) - 2)]
+            nullable = set(ve)
+            if alpha[-1] in ve and alpha[-2] in ve:
+                nullable.add(helpers[-1])
+            for i in range(len(helpers) - 2, -1, -1):
+                if helpers[i + 1] in nullable and alpha[i + 1] in ve:
+                    nullable.add(helpers[i])
+            heads = [a] + helpers
+            tails = helpers + [alpha[-1]]
+            for i, h in enumerate(heads):
+                binary = [alpha[i], tails[i]]
+                if h == a:
+                    for beta in drop_nullable(binary, nullable):
+                        rhs[beta] = None
+                else:
+                    p1[h] = [list(beta) for beta in drop_nullable(binary, nullable)]
+        p1[a] = [list(beta) for beta in rhs]
     p1 = { a : p1[a] for a in p1 if p1[a] != [] }
-    while True:
-        size_p1 = len(p1)
-        for a in p1:
-            for alpha in p1[a]:
-                for x in alpha:
-                    if x in ve:
-                        idx_x = alpha.index(x)
-                        alpha1 = alpha[:idx_x]
-                        alpha2 = alpha[idx_x + 1:]
-                        alpha3 = alpha1 + alpha2
-                        if alpha3 != []:
-                            p1[a].append(alpha3)
-        new_size_p1 = len(p1)
-        if size_p1 == new_size_p1:
-            break
     return p1
 
 def add_epsilon(s, p, new_p, ve):
@@ -162,33 +199,127 @@ def add_epsilon(s, p, new_p, ve):
 
 # Variable substitution production simplification
     
-def comp_var_clos(p, v, v_set):
-    p1 = { a : [] for a in p } 
+def unit_graph_sccs(nodes, succ):
+    '''
+    Computes the strongly connected components of the graph with the
+    given nodes (numbered 0 .. len(nodes) - 1) and successor lists,
+    with an iterative version of Tarjan's algorithm.
+    Returns the component of each node and the number of components,
+    which are numbered in reverse topological order.
+    '''
+    n = len(nodes)
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    comp = [-1] * n
+    stack = []
+    counter = 0
+    n_comps = 0
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [(root, iter(succ[root]))]
+        while work:
+            v, it = work[-1]
+            descended = False
+            for w in it:
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append((w, iter(succ[w])))
+                    descended = True
+                    break
+                elif on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            if descended:
+                continue
+            work.pop()
+            if work != []:
+                u = work[-1][0]
+                low[u] = min(low[u], low[v])
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    comp[w] = n_comps
+                    if w == v:
+                        break
+                n_comps += 1
+    return comp, n_comps
+
+def comp_unit_closure(p, v_set):
+    '''
+    Computes, for every variable A, the list of the variables B != A
+    such that A derives B using only unit productions (A → B).
+    The graph of unit productions is built once and condensed by its
+    strongly connected components, and the closure of each component
+    is a bitset of variables, computed in reverse topological order.
+    '''
+    nodes = list(p.keys()) + sorted(v for v in v_set if v not in p)
+    index = { a : i for i, a in enumerate(nodes) }
+    succ = [[] for _ in nodes]
     for a in p:
         for alpha in p[a]:
             if len(alpha) == 1 and alpha[0] in v_set:
-                p1[a].append(alpha)
-    if p1[v] != []:
-        clos = p1[v][0]
-    else:
-        clos = []
+                succ[index[a]].append(index[alpha[0]])
+    comp, n_comps = unit_graph_sccs(nodes, succ)
+    members = [0] * n_comps
+    comp_succ = [set() for _ in range(n_comps)]
+    for i in range(len(nodes)):
+        members[comp[i]] |= 1 << i
+        for j in succ[i]:
+            if comp[j] != comp[i]:
+                comp_succ[comp[i]].add(comp[j])
+    # Components are numbered sinks first.
+    reach = [0] * n_comps
+    for c in range(n_comps):
+        reach[c] = members[c]
+        for d in comp_succ[c]:
+            reach[c] |= reach[d]
+    # The variables of each bitset, from its binary representation.
+    reach_vars = [[j for j, bit in enumerate(bin(r)[:1:-1]) if bit == "1"] for r in reach]
+    clos = {}
+    for i, a in enumerate(nodes):
+        clos[a] = [nodes[j] for j in reach_vars[comp[i]] if j != i]
     return clos
 
+def comp_var_clos(p, v, v_set, clos=None):
+    '''
+    Returns the list of the variables that v derives using only unit
+    productions, looked up in clos, the result of
+    comp_unit_closure(p, v_set). Callers that need the closure of many
+    variables compute clos once and pass it to every call; without it,
+    the closure of all variables is computed for this call.
+    '''
+    if clos is None:
+        clos = comp_unit_closure(p, v_set)
+    return clos.get(v, [])
+
 def remove_prod_replace_var(p, v_set, clos):
+    '''
+    Removes the unit productions of p, adding to each variable A the
+    non-unit productions of the variables in clos[A], which must be
+    transitively closed, as computed by comp_unit_closure.
+    '''
     p1 = { a : [] for a in p }
     for a in p:
         for alpha in p[a]:
             if len(alpha) > 1 or (len(alpha) == 1 and alpha[0] not in v_set):
                 p1[a].append(alpha)
-            else:
-                continue 
-    for a in v_set:
-        for b in clos[a]:
-            if b in p.keys():
-                for alpha in p[b]:
-                    if len(alpha) > 1 or (len(alpha) == 1 and
-                                          alpha[0] not in v_set):
-                        p1[a].append(alpha)
+    for a in p1:
+        seen = { tuple(alpha) for alpha in p1[a] }
+        for b in clos.get(a, []):
+            for alpha in p.get(b, []):
+                if (len(alpha) > 1 or (len(alpha) == 1 and alpha[0] not in v_set)) \
+                   and tuple(alpha) not in seen:
+                    seen.add(tuple(alpha))
+                    p1[a].append(alpha)
     return p1
 
 if __name__ == "__main__":
@@ -231,9 +362,7 @@ if __name__ == "__main__":
     initial3 = "S"
     print("Original production set")
     pp.pprint(p3)
-    clos = {a : None for a in v3}
-    for v in v3:
-        clos[v] = comp_var_clos(p3, v, v3)
+    clos = comp_unit_closure(p3, v3)
     print("Production set without variable substitution productions")
     pp.pprint(remove_prod_replace_var(p3, v3, clos))
 
@@ -0,0 +1,194 @@
+# Chomsky normal form and the CYK recognizer.
+
+# The productions of a grammar are represented as in cfg_simp: a
+# dictionary whose keys are the LHS and whose values are lists of RHS.
+# The grammar must have been simplified by cfg_simp, that is, it has no
+# useless symbols, no unit productions and no empty productions except
+# possibly ["epsilon"] for the initial symbol.
+
+import pprint
+from cfg_simp import fresh_var
+
+def to_cnf(p, s):
+    '''
+    Transforms the simplified grammar with productions p and initial
+    symbol s into Chomsky normal form: every RHS is either a terminal
+    or two variables, and only s may have the RHS ["epsilon"], which,
+    as in the output of add_epsilon, only stands for the empty word.
+    Terminals in RHS of length at least two are replaced by new
+    variables T_a → a, and longer RHS are split into chains of new
+    variables, shared between productions with the same suffix.
+    '''
+    # New variables must differ from the variables and the terminals.
+    used = set(p.keys()) | { x for a in p for alpha in p[a] for x in alpha }
+    term_var = {}
+    suffix_var = {}
+    cnf = { a : [] for a in p }
+
+    def var_of(x):
+        if x in p:
+            return x
+        if x not in term_var:
+            term_var[x] = fresh_var("T_" + x, used)
+            cnf[term_var[x]] = [[x]]
+        return term_var[x]
+
+    for a in p:
+        for alpha in p[a]:
+            if alpha == ["epsilon"]:
+                if a != s:
+                    raise Exception("Empty production " + a + " → epsilon is not allowed in CNF")
+                cnf[a].append(alpha)
+            elif len(alpha) == 1:
+                if alpha[0] in p:
+                    raise Exception("Unit production " + a + " → " + alpha[0] + " is not allowed in CNF")
+                cnf[a].append(alpha)
+            else:
+                xs = [var_of(x) for x in alpha]
+                # Splits X1 X2 ... Xk into X1 N1, N1 → X2 N2, ...,
+                # N_(k-2) → X_(k-1) X_k.
+                right = xs[-1]
+                for i in range(len(xs) - 2, 0, -1):
+                    suffix = (xs[i], right)
+                    if suffix not in suffix_var:
+                        suffix_var[suffix] = fresh_var(a + "_" + str(len(suffix_var) + 1), used)
+                        cnf[suffix_var[suffix]] = [list(suffix)]
+                    right = suffix_var[suffix]
+                rhs = [xs[0], right]
+                if rhs not in cnf[a]:
+                    cnf[a].append(rhs)
+    return cnf
+
+class CYKGrammar:
+    '''
+    Grammar in CNF compiled for the CYK algorithm. Variables are
+    numbered and sets of variables are integer bitsets. unary maps a
+    terminal to the set of variables that produce it, binary maps a
+    pair (B, C) of variable numbers to the set of variables A with
+    A → B C, and by_left groups the pairs of binary by B.
+    '''
+    __slots__ = ("variables", "index", "unary", "binary", "by_left", "start", "empty")
+
+    def __init__(self, variables, unary, binary, start, empty):
+        self.variables = variables
+        self.index = { a : i for i, a in enumerate(variables) }
+        self.unary = unary
+        self.binary = binary
+        self.by_left = [[] for _ in variables]
+        for (b, c), mask in binary.items():
+            self.by_left[b].append((c, mask))
+        self.start = start
+        self.empty = empty
+
+def compile_cnf(cnf, s):
+    variables = list(cnf.keys())
+    index = { a : i for i, a in enumerate(variables) }
+    unary = {}
+    binary = {}
+    for a in cnf:
+        bit = 1 << index[a]
+        for alpha in cnf[a]:
+            if len(alpha) == 1 and alpha != ["epsilon"]:
+                unary[alpha[0]] = unary.get(alpha[0], 0) | bit
+            elif len(alpha) == 2:
+                pair = (index[alpha[0]], index[alpha[1]])
+                binary[pair] = binary.get(pair, 0) | bit
+    return CYKGrammar(variables, unary, binary, index[s], ["epsilon"] in cnf[s])
+
+def bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def cyk(g, tokens):
+    '''
+    Checks whether the CYKGrammar g generates the list of terminals
+    tokens. cells[l][i] is the set of variables that generate the l
+    tokens starting at position i.
+    '''
+    n = len(tokens)
+    if n == 0:
+        return g.empty
+    cells = [None, [g.unary.get(x, 0) for x in tokens]]
+    for l in range(2, n + 1):
+        row = []
+        for i in range(n - l + 1):
+            acc = 0
+            for m in range(1, l):
+                left = cells[m][i]
+                right = cells[l - m][i + m]
+                if left == 0 or right == 0:
+                    continue
+                for b in bits(left):
+                    for c, mask in g.by_left[b]:
+                        if right >> c & 1:
+                            acc |= mask
+            row.append(acc)
+        cells.append(row)
+    return cells[n][0] >> g.start & 1 == 1
+
+def cyk_many(g, sentences):
+    '''
+    Checks a batch of sentences with a NumPy formulation of CYK.
+    Sentences of the same length are checked together, with boolean
+    cells of shape (sentences, positions, variables). Each split
+    gathers, for all sentences and positions, the left cell at B and
+    the right cell at C of every binary rule A → B C, and ORs them into
+    the cell at A, so that memory grows with the number of binary
+    rules rather than with the square of the number of variables.
+    Returns the list of results in the order of sentences.
+    '''
+    import numpy as np
+    m = len(g.variables)
+    terminals = { x : i + 1 for i, x in enumerate(g.unary) }
+    # Row 0 is for terminals that no variable produces.
+    unary = np.zeros((len(terminals) + 1, m), dtype=bool)
+    for x, i in terminals.items():
+        for a in bits(g.unary[x]):
+            unary[i, a] = True
+    # Binary rules (A, B, C) sorted by A; heads are the distinct A and
+    # starts the index of the first rule of each.
+    rules = sorted((a, b, c) for (b, c), mask in g.binary.items() for a in bits(mask))
+    left_of = np.array([b for _, b, _ in rules], dtype=np.intp)
+    right_of = np.array([c for _, _, c in rules], dtype=np.intp)
+    heads, starts = np.unique(np.array([a for a, _, _ in rules], dtype=np.intp), return_index=True)
+    sentences = list(sentences)
+    by_length = {}
+    for k, tokens in enumerate(sentences):
+        by_length.setdefault(len(tokens), []).append(k)
+    results = [False] * len(sentences)
+    for n, ks in by_length.items():
+        if n == 0:
+            for k in ks:
+                results[k] = g.empty
+            continue
+        ids = np.array([[terminals.get(x, 0) for x in sentences[k]] for k in ks])
+        cells = [None, unary[ids]]
+        for l in range(2, n + 1):
+            width = n - l + 1
+            acc = np.zeros((len(ks), width, m), dtype=bool)
+            if len(rules) > 0:
+                for split in range(1, l):
+                    left = cells[split][:, :width, left_of]
+                    right = cells[l - split][:, split:split + width, right_of]
+                    acc[:, :, heads] |= np.logical_or.reduceat(left & right, starts, axis=2)
+            cells.append(acc)
+        for row, k in enumerate(ks):
+            results[k] = bool(cells[n][row, 0, g.start])
+    return results
+
+if __name__ == "__main__":
+    pp = pprint.PrettyPrinter()
+    print("* CNF and CYK example")
+    p = { "S" : [["a", "S", "b"], ["a", "b"], ["epsilon"]] }
+    print("Original production set")
+    pp.pprint(p)
+    cnf = to_cnf(p, "S")
+    print("Production set in CNF")
+    pp.pprint(cnf)
+    g = compile_cnf(cnf, "S")
+    words = ["", "ab", "aabb", "aab", "abab", "aaabbb"]
+    for w in words:
+        print(repr(w), cyk(g, list(w)))
+    print(cyk_many(g, [list(w) for w in words]))
@@ -0,0 +1,184 @@
+# Christiano Braga
+# Oct. 2026
+
+# Compact representation of context-free grammars.
+
+# The modules in cfg_simp, greibach and pda represent the productions of
+# a grammar as a dictionary where each item is a set of RHS productions
+# with the same LHS: the key is the LHS and the value is a list, whose
+# elements are each RHS of the given LHS in the production set.
+
+# A Grammar interns the symbols of such a dictionary to integers,
+# stores each RHS as a tuple of symbol numbers in a list indexed by
+# production number, and indexes the productions by LHS and by first
+# symbol. The sets of the RHS of each variable hold the same tuples, so
+# that productions built by substitution are not copied again.
+# The empty RHS ["epsilon"] is stored as the empty sequence.
+# Productions can be removed: they stay in the lists, but leave the
+# indexes, so that transformations that substitute productions update
+# a Grammar in place.
+
+# The Earley parser of pda/cfg_pda.py and the transformation to
+# Greibach normal form in greibach/greibach.py work on a Grammar,
+# converting the dictionary once at their entry.
+
+# The RHS are not stored as a flat array of symbols with offsets: the
+# transformations build their productions as tuples and share them
+# with rhs_sets, which a flat array would copy. The simplifications of
+# cfg_simp/cfg_simp.py do not use a Grammar, and still work on the
+# dictionary representation.
+
+from array import array
+
+class Grammar:
+    '''
+    Production set with symbols interned to integers. Production r has
+    LHS lhs[r] and RHS rhs[r], a tuple. by_lhs[x] and by_first[x] are
+    the sets of the productions with LHS x and with RHS starting with
+    x, respectively, rhs_sets[x] is the set of the RHS tuples of the
+    productions with LHS x, and is_var[x] tells whether symbol x is a
+    variable. Production numbers grow in the order the productions are
+    added.
+    '''
+    __slots__ = ("symbols", "index", "is_var", "lhs", "rhs", "by_lhs", "by_first", "rhs_sets")
+
+    def __init__(self):
+        self.symbols = []
+        self.index = {}
+        self.is_var = bytearray()
+        self.lhs = array("i")
+        self.rhs = []
+        self.by_lhs = []
+        self.by_first = []
+        self.rhs_sets = []
+
+    def __len__(self):
+        return sum(map(len, self.by_lhs))
+
+    def intern(self, x, is_var=False):
+        '''
+        Returns the number of symbol x, adding it if it is new.
+        '''
+        i = self.index.get(x)
+        if i is None:
+            i = len(self.symbols)
+            self.symbols.append(x)
+            self.index[x] = i
+            self.is_var.append(0)
+            self.by_lhs.append(set())
+            self.by_first.append(set())
+            self.rhs_sets.append(set())
+        if is_var:
+            self.is_var[i] = 1
+        return i
+
+    def add_rule(self, a, alpha):
+        '''
+        Adds the production a → alpha, where a is a symbol number and
+        alpha a sequence of symbol numbers, unless it already exists.
+        Returns the number of the production, or None if it existed.
+        '''
+        alpha = tuple(alpha)
+        rhs_set = self.rhs_sets[a]
+        n = len(rhs_set)
+        rhs_set.add(alpha)
+        if len(rhs_set) == n:
+            return None
+        r = len(self.lhs)
+        self.lhs.append(a)
+        self.rhs.append(alpha)
+        self.by_lhs[a].add(r)
+        if alpha != ():
+            self.by_first[alpha[0]].add(r)
+        return r
+
+    def add_rules(self, a, rhs_list):
+        '''
+        Adds the productions a → alpha for each tuple alpha of rhs_list,
+        which must be distinct and not be productions of a already.
+        '''
+        r = len(self.lhs)
+        self.rhs_sets[a].update(rhs_list)
+        self.lhs.extend([a] * len(rhs_list))
+        self.rhs.extend(rhs_list)
+        self.by_lhs[a].update(range(r, r + len(rhs_list)))
+        by_first = self.by_first
+        for r, alpha in enumerate(rhs_list, r):
+            if alpha != ():
+                by_first[alpha[0]].add(r)
+
+    def remove_rule(self, r):
+        '''
+        Removes production r from the indexes. Its number is not reused.
+        '''
+        a = self.lhs[r]
+        alpha = self.rhs[r]
+        self.rhs_sets[a].remove(alpha)
+        self.by_lhs[a].remove(r)
+        if alpha != ():
+            self.by_first[alpha[0]].remove(r)
+
+    def rule_rhs(self, r):
+        return self.rhs[r]
+
+    def rules_of(self, a):
+        # Productions with LHS a, in the order they were added.
+        return sorted(self.by_lhs[a])
+
+    def copy(self):
+        '''
+        Returns a Grammar with the same symbols and productions.
+        '''
+        g = Grammar()
+        g.symbols = self.symbols.copy()
+        g.index = self.index.copy()
+        g.is_var = self.is_var[:]
+        g.lhs = self.lhs[:]
+        g.rhs = self.rhs.copy()
+        g.by_lhs = [set(rs) for rs in self.by_lhs]
+        g.by_first = [set(rs) for rs in self.by_first]
+        g.rhs_sets = [set(alphas) for alphas in self.rhs_sets]
+        return g
+
+    def symbol_copy(self):
+        '''
+        Returns a Grammar with the same symbols and no productions.
+        '''
+        g = Grammar()
+        g.symbols = self.symbols.copy()
+        g.index = self.index.copy()
+        g.is_var = self.is_var[:]
+        g.by_lhs = [set() for _ in self.symbols]
+        g.by_first = [set() for _ in self.symbols]
+        g.rhs_sets = [set() for _ in self.symbols]
+        return g
+
+    def variables(self):
+        return [x for x in range(len(self.symbols)) if self.is_var[x]]
+
+def make_grammar(p):
+    '''
+    Builds a Grammar from a production dictionary. Its keys are the
+    variables and the other symbols are terminals.
+    '''
+    g = Grammar()
+    for a in p:
+        g.intern(a, True)
+    for a in p:
+        a_id = g.index[a]
+        for alpha in p[a]:
+            if alpha == ["epsilon"]:
+                g.add_rule(a_id, ())
+            else:
+                g.add_rule(a_id, [g.intern(x) for x in alpha])
+    return g
+
+def grammar_to_dict(g):
+    '''
+    Converts a Grammar back into a production dictionary.
+    '''
+    p = {}
+    name = g.symbols.__getitem__
+    for a in g.variables():
+        p[g.symbols[a]] = [list(map(name, g.rule_rhs(r))) or ["epsilon"] for r in g.rules_of(a)]
+    return p
@@ -10,61 +10,370 @@
 # implemented as a list and so is T. S is a string and P is as
 # described above.
 
+# The transformation to GNF has three stages: r_lte_s orders the
+# productions as A_r → A_s α, with r < s, and eliminates the left
+# recursive productions A_r → A_r α as it goes, so that
+# left_recursion_elimination is no longer a separate stage after it;
+# begin_with_terminal substitutes the leading variables; and
+# terminal_followed_by_word_of_variables replaces the terminals after
+# the first symbol of each RHS by new variables.
+
+# The transformations also accept P as a Grammar (see
+# grammar/grammar.py), with symbols interned to integers, and return
+# their result in the format they are given. to_gnf and
+# search_variable_order intern a dictionary once and run every stage
+# on the Grammar.
+
+import os
+import sys
 import pprint
+import random
 from termcolor import colored
-import copy
 import itertools
+from concurrent.futures import ProcessPoolExecutor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cfg_simp"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "grammar"))
+from cfg_simp import fresh_var, unit_graph_sccs
+from grammar import Grammar, make_grammar, grammar_to_dict
 
 def sort_variables(v):
     v_set = set(v)
     v_list = list(v_set)
     return v_list
 
-def r_lte_s(v, p_0):
-    p = copy.deepcopy(p_0)
-    for a_r in v:
-        for a_s in v: 
-            if v.index(a_s) < v.index(a_r):
-                rhs_list = p[a_r]
-                for rhs in rhs_list:
-                    if rhs[0] == a_s:
-                        for beta in p[a_s]:
-                            beta_copy = beta.copy()
-                            beta_copy.extend(rhs[1:]) # beta alpha
-                            p[a_r].append(beta_copy)
-                        p[a_r].remove(rhs)
-    return p
+def as_grammar(p):
+    return p if isinstance(p, Grammar) else make_grammar(p)
+
+def like(p, g):
+    # Returns g in the format of p: a Grammar or a production dictionary.
+    return g if isinstance(p, Grammar) else grammar_to_dict(g)
+
+def variable_order(v, g):
+    '''
+    Numbers the variables of the Grammar g in the order of the list v
+    of their names. Variables that are not in v come after those in v.
+    '''
+    order = { a : i for i, a in enumerate(v) }
+    for x in g.variables():
+        if g.symbols[x] not in order:
+            order[g.symbols[x]] = len(order)
+    return { x : order[g.symbols[x]] for x in g.variables() }
+
+def substitute_leading(a_r, rhs_list, order, g, limit=None):
+    '''
+    Replaces, in the RHS of a_r, every leading variable A_s with
+    order[A_s] < order[a_r] by the RHS of A_s in the Grammar g, until
+    all of them start with a terminal or with a variable A_s such that
+    r ≤ s. The RHS of each such A_s in g must already start with a
+    terminal or with a variable of greater order. The RHS a_r alone,
+    which derives nothing new, is dropped. Returns None if there are
+    more than limit RHS.
+    '''
+    r = order[a_r]
+    result = {}
+    stack = list(reversed(rhs_list))
+    while stack:
+        rhs = stack.pop()
+        x = rhs[0] if rhs != () else None
+        if order.get(x, r) < r:
+            tail = rhs[1:]
+            for s in sorted(g.by_lhs[x], reverse=True):
+                stack.append(g.rule_rhs(s) + tail)
+        elif rhs != (a_r,):
+            result[rhs] = None
+            if limit is not None and len(result) > limit:
+                return None
+    return list(result)
+
+def split_left_recursion(a_r, rhs_list, b_r):
+    '''
+    Eliminates the productions A_r → A_r α_i of a_r: with the others
+    A_r → β_j, they become A_r → β_j | β_j B_r and B_r → α_i | α_i B_r.
+    RHS are tuples of symbol numbers. Returns the RHS of A_r and the
+    RHS of B_r, which are empty if a_r is not left recursive.
+    '''
+    alphas = [rhs[1:] for rhs in rhs_list if len(rhs) > 1 and rhs[0] == a_r]
+    betas = [rhs for rhs in rhs_list if rhs == () or rhs[0] != a_r]
+    if alphas == []:
+        # A_r → A_r only derives what the other productions derive.
+        return betas, []
+    return betas + [beta + (b_r,) for beta in betas], \
+        alphas + [alpha + (b_r,) for alpha in alphas]
+
+def recursion_var(g, a_r, rhs_list, used):
+    # The new variable A_r_rr of a left recursive a_r, or None.
+    if any(len(rhs) > 1 and rhs[0] == a_r for rhs in rhs_list):
+        return g.intern(fresh_var(g.symbols[a_r] + "_rr", used), True)
+    return None
+
+def r_lte_s(v, p_0, limit=None):
+    '''
+    Transforms the productions into A_r → A_s α, where r < s, or
+    A_r → a α, with a terminal, following the order of the variables
+    in v. Variables are processed in order: the leading variables of
+    lower order of A_r are substituted by their (already transformed)
+    RHS, and the remaining productions A_r → A_r α are eliminated by
+    split_left_recursion, with a new variable A_r_rr. The result has
+    no left recursive productions, so left_recursion_elimination is
+    not applied after it.
+    p_0 is a production dictionary or a Grammar, and the result has
+    the same format. Builds a new production set and leaves p_0
+    unchanged, or returns None if it would have more than limit
+    productions.
+    '''
+    g_0 = as_grammar(p_0)
+    order = variable_order(v, g_0)
+    used = set(g_0.symbols)
+    g = g_0.symbol_copy()
+    new_rules = []
+    total = 0
+    for a_r in sorted(order, key=order.get):
+        rhs_list = substitute_leading(a_r, [g_0.rule_rhs(r) for r in g_0.rules_of(a_r)], order, g,
+                                      None if limit is None else limit - total)
+        if rhs_list is None:
+            return None
+        b_r = recursion_var(g, a_r, rhs_list, used)
+        a_list, b_list = split_left_recursion(a_r, rhs_list, b_r)
+        g.add_rules(a_r, a_list)
+        if b_list != []:
+            new_rules.append((b_r, b_list))
+        total += len(a_list) + len(b_list)
+        if limit is not None and total > limit:
+            return None
+    for b_r, b_list in new_rules:
+        g.add_rules(b_r, b_list)
+    return like(p_0, g)
 
 def left_recursion_elimination(v, p_0):
-    p = copy.deepcopy(p_0)
-    excluded = []
-    new_p = {}
-    for a_r in p:
-        for i, rhs in enumerate(p[a_r]):
-            if rhs[0] == a_r:
-                rhs_copy = rhs.copy()
-                b_r = rhs_copy[0] + "_rr"
-                v = v.append(b_r)
-                alpha = rhs_copy[1:]
-                alpha_x = alpha.copy()
-                alpha_x.append(b_r)
-                new_p.update({ b_r : [alpha, alpha_x] })
-                p[a_r].remove(rhs)
-                excluded += a_r
-    p.update(new_p)
-    for a_r in excluded:
-        rhs_list = copy.deepcopy(p[a_r])
-        for rhs in rhs_list:
-            rhs_copy = rhs.copy()
-            rhs_copy.append(a_r + "_rr")
-            p[a_r].append(rhs_copy)
-    return p
-
-def begin_with_terminal(p):
-    pass
+    '''
+    Eliminates the productions A_r → A_r α of every variable, adding a
+    new variable A_r_rr for each left recursive A_r.
+    Builds a new production set and leaves p_0 unchanged. r_lte_s
+    already does this for each variable it transforms.
+    '''
+    g_0 = as_grammar(p_0)
+    used = set(g_0.symbols)
+    g = g_0.symbol_copy()
+    new_rules = []
+    for a_r in g_0.variables():
+        rhs_list = [g_0.rule_rhs(r) for r in g_0.rules_of(a_r)]
+        b_r = recursion_var(g, a_r, rhs_list, used)
+        a_list, b_list = split_left_recursion(a_r, rhs_list, b_r)
+        g.add_rules(a_r, a_list)
+        if b_list != []:
+            new_rules.append((b_r, b_list))
+    for b_r, b_list in new_rules:
+        g.add_rules(b_r, b_list)
+    return like(p_0, g)
+
+def expand_leading_variables(g, limit=None):
+    '''
+    Substitutes, in the Grammar g, leading variables until every RHS
+    begins with a terminal. The graph from each variable to the
+    leading variables of its RHS must be acyclic, as in the output of
+    r_lte_s. Its variables are visited sinks first: the RHS of each
+    variable then begin with terminals, and are substituted in the
+    productions that begin with it, found by g.by_first. Updates g, and
+    returns False as soon as g has more than limit productions.
+    '''
+    # total is len(g), kept up to date as productions are substituted.
+    total = len(g)
+    if limit is not None and total > limit:
+        return False
+    for comp in reversed(leading_components(g)):
+        x = comp[0]
+        if len(comp) > 1 or any(g.lhs[r] == x for r in g.by_first[x]):
+            raise Exception("Left recursive derivation of " + g.symbols[x])
+        betas = [g.rule_rhs(r) for r in g.rules_of(x)]
+        for r in sorted(g.by_first[x]):
+            a = g.lhs[r]
+            tail = g.rule_rhs(r)[1:]
+            g.remove_rule(r)
+            total -= 1
+            for beta in betas:
+                if g.add_rule(a, beta + tail) is not None:
+                    total += 1
+                    if limit is not None and total > limit:
+                        return False
+    return True
+
+def begin_with_terminal(p, limit=None):
+    '''
+    Substitutes leading variables until every RHS begins with a
+    terminal, with expand_leading_variables. Builds a new production
+    set, in the format of p, and leaves p unchanged. Returns None if
+    the result would have more than limit productions.
+    '''
+    g = p.copy() if isinstance(p, Grammar) else make_grammar(p)
+    if not expand_leading_variables(g, limit):
+        return None
+    return like(p, g)
 
 def terminal_followed_by_word_of_variables(p):
-    pass
+    '''
+    Replaces each terminal x that does not begin a RHS by a new
+    variable T_x, with the production T_x → x. Every RHS of p must
+    begin with a terminal, as in the output of begin_with_terminal.
+    '''
+    g_0 = as_grammar(p)
+    used = set(g_0.symbols)
+    g = g_0.symbol_copy()
+    rules = []
+    for a in g_0.variables():
+        for r in g_0.rules_of(a):
+            alpha = g_0.rule_rhs(r)
+            if alpha != () and g_0.is_var[alpha[0]]:
+                raise Exception("Production " + g_0.symbols[a] + " → " +
+                                " ".join(g_0.symbols[x] for x in alpha) + " does not begin with a terminal")
+            rules.append((a, alpha))
+    # image[x] is x for the variables and T_x for the terminals x that
+    # occur after the first symbol of a RHS, numbered in the order of
+    # their first occurrence.
+    image = list(range(len(g_0.symbols)))
+    term_var = {}
+    for x in dict.fromkeys(itertools.chain.from_iterable(alpha[1:] for _, alpha in rules)):
+        if not g_0.is_var[x]:
+            term_var[x] = image[x] = g.intern(fresh_var("T_" + g_0.symbols[x], used), True)
+    for a, alpha in rules:
+        g.add_rule(a, alpha[:1] + tuple(map(image.__getitem__, alpha[1:])))
+    for x in term_var:
+        g.add_rule(term_var[x], (x,))
+    return like(p, g)
+
+def to_gnf(v, p, limit=None):
+    '''
+    Transforms the productions p of a grammar without empty
+    productions into Greibach normal form, using the order of the
+    variables in v. p is a production dictionary or a Grammar, which
+    every stage works on, and the result has the same format. Returns
+    None if a stage would produce more than limit productions.
+    '''
+    g = r_lte_s(v, as_grammar(p), limit)
+    if g is None or not expand_leading_variables(g, limit):
+        return None
+    g = terminal_followed_by_word_of_variables(g)
+    if limit is not None and gnf_size(g) > limit:
+        return None
+    return like(p, g)
+
+# Variable ordering
+
+# The size of the GNF depends heavily on the order of the variables:
+# every production A_r → A_s α with s < r is substituted by all the RHS
+# of A_s. Only the leading variables of the RHS matter, so the orders
+# are derived from the graph with an edge from A to B when a RHS of A
+# begins with B.
+
+def leading_components(g):
+    '''
+    Computes the strongly connected components of the leading variable
+    graph of the Grammar g, whose edges to each variable x are the
+    productions of g.by_first[x]. Returns the list of components, each
+    a list of variable numbers, in topological order.
+    '''
+    nodes = g.variables()
+    index = { x : i for i, x in enumerate(nodes) }
+    succ = [[] for _ in nodes]
+    for x in nodes:
+        for r in g.by_first[x]:
+            succ[index[g.lhs[r]]].append(index[x])
+    comp, n_comps = unit_graph_sccs(nodes, succ)
+    comps = [[] for _ in range(n_comps)]
+    for i, x in enumerate(nodes):
+        comps[comp[i]].append(x)
+    # unit_graph_sccs numbers the components sinks first.
+    comps.reverse()
+    return comps
+
+def leading_graph_sccs(p):
+    '''
+    Computes the strongly connected components of the leading variable
+    graph of p. Returns the list of components, each a list of
+    variables, in topological order.
+    '''
+    g = as_grammar(p)
+    return [[g.symbols[x] for x in comp] for comp in leading_components(g)]
+
+def sorted_components(g):
+    # Components of the leading variable graph of the Grammar g, with
+    # the variables with fewer productions first.
+    return [sorted(comp, key=lambda x: len(g.by_lhs[x])) for comp in leading_components(g)]
+
+def choose_variable_order(p):
+    '''
+    Orders the variables so that leading variables come after the
+    variables whose RHS they begin: following the topological order
+    of the components of the leading variable graph, only the
+    productions within a component need substitutions. Within a
+    component, variables with fewer productions come first, since
+    their RHS are the ones copied into the others.
+    '''
+    g = as_grammar(p)
+    return [g.symbols[x] for comp in sorted_components(g) for x in comp]
+
+def candidate_orders(p, n, seed=0):
+    '''
+    Yields choose_variable_order(p) and up to n - 1 other orders that
+    keep its order of components and shuffle the variables within the
+    components with more than one variable.
+    '''
+    g = as_grammar(p)
+    comps = [[g.symbols[x] for x in comp] for comp in sorted_components(g)]
+    yield [a for comp in comps for a in comp]
+    if all(len(comp) == 1 for comp in comps):
+        return
+    rng = random.Random(seed)
+    seen = set()
+    for _ in range(n - 1):
+        v = []
+        for comp in comps:
+            comp = comp.copy()
+            rng.shuffle(comp)
+            v.extend(comp)
+        if tuple(v) not in seen:
+            seen.add(tuple(v))
+            yield v
+
+def gnf_size(p):
+    return len(p) if isinstance(p, Grammar) else sum(len(p[a]) for a in p)
+
+def order_size(args):
+    v, p, limit = args
+    p = to_gnf(v, p, limit)
+    return None if p is None else gnf_size(p)
+
+def search_variable_order(p, n=16, workers=None, seed=0, limit=10 ** 6):
+    '''
+    Searches for a variable order that yields a small GNF. Candidate
+    orders are evaluated in rounds in a process pool; the size of the
+    best GNF found so far bounds the next round, whose runs stop as
+    soon as one of their stages exceeds it. If workers is None or at
+    most 1, the candidates are evaluated in this process, each bounded
+    by the best one before it. Every candidate, including the first,
+    is bounded by limit productions. Returns the best order and its GNF
+    size, or None and None if no candidate stays within limit.
+    '''
+    # The grammar is interned once for all the candidates.
+    p = as_grammar(p)
+    candidates = candidate_orders(p, n, seed)
+    best, best_size = None, None
+    if workers is None or workers <= 1:
+        for v in candidates:
+            s = order_size((v, p, limit if best_size is None else best_size - 1))
+            if s is not None:
+                best, best_size = v, s
+        return best, best_size
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(itertools.islice(candidates, workers))
+            if batch == []:
+                break
+            budget = limit if best_size is None else best_size - 1
+            sizes = executor.map(order_size, [(v, p, budget) for v in batch])
+            for v, s in zip(batch, sizes):
+                if s is not None and (best_size is None or s < best_size):
+                    best, best_size = v, s
+    return best, best_size
 
 def print_prod(p):
     for key in p.keys():
@@ -72,13 +381,23 @@ def print_prod(p):
         for rhs in p[key][1:]:
             print(colored(" | ", 'white', attrs=['bold']) + colored(" ".join(rhs), 'cyan'))
     
-def mk_example(ex_num, v_0, p_0):
+def mk_example(ex_num, v_0, p_0, search=False):
+    '''
+    Prints the transformation of p_0 to GNF for every order of the
+    variables v_0 or, with search, only for the order found by
+    search_variable_order.
+    '''
     pp = pprint.PrettyPrinter(indent=4)
     print(colored("Example " + str(ex_num), attrs=['bold']))
     print("Original production set.")
     print_prod(p_0)
-    
-    for i, v in enumerate(list(itertools.permutations(v_0))):
+
+    if search:
+        v = search_variable_order(p_0)[0]
+        orders = [] if v is None else [v]
+    else:
+        orders = itertools.permutations(v_0)
+    for i, v in enumerate(orders):
         print(colored("Example "+ str(ex_num) + "." + str(i), 'green', attrs=['bold']))
         
         # First step: grammar simplification
@@ -87,21 +406,18 @@ def mk_example(ex_num, v_0, p_0):
         pp.pprint(v)
 
         # Third and fourth steps: production set transformation to
-        # A_r → A_s α, where r ≤ s and removal of productions of the form
-        # Ar → Arα.
-        
-        print(colored("Production set transformation to A_r → A_s α, where r ≤ s.", 'blue'))
+        # A_r → A_s α, where r < s, with the elimination of productions
+        # of the form A_r → A_r α.
+
+        print(colored("Production set transformation to A_r → A_s α, where r < s, eliminating A_r → A_r α.", 'blue'))
         p_i = r_lte_s(v, p_0)
         print_prod(p_i)
-        print(colored("Production set elimination of A_r → A_r α.", 'blue'))    
-        p_i = left_recursion_elimination(v, p_i)
-        print_prod(p_i)
-        print(colored("Each production begining with a terminal.", 'grey'))
+        print(colored("Each production begining with a terminal.", 'blue'))
         p_i = begin_with_terminal(p_i)
-        pp.pprint("TO DO!")    
-        print(colored("Each production begining with a terminal followed by a word of variables.", 'grey'))
+        print_prod(p_i)
+        print(colored("Each production begining with a terminal followed by a word of variables.", 'blue'))
         p_i = terminal_followed_by_word_of_variables(p_i)
-        pp.pprint("TO DO!")
+        print_prod(p_i)
     
 if __name__ == "__main__":
     print(colored("Examples of transformations from CFG to Greibach normal form", attrs=['bold']))
@@ -120,3 +436,11 @@ if __name__ == "__main__":
     s1  = "A"
     mk_example(2, v1, p1)
     
+
+    ### Example 3: example 2 with the order found by the search
+    mk_example(3, v1, p1, search=True)
+
+    ### Example 4: the order found by the search and the size of its GNF
+    v, size = search_variable_order(p1)
+    print(colored("Example 4", attrs=['bold']))
+    print("Best variable order:", v, "with", size, "productions in GNF.")
@@ -1,4 +1,8 @@
 #!/bin/bash
 
+# Prints the transformation of the examples to GNF: r_lte_s, which also
+# eliminates left recursion, begin_with_terminal and
+# terminal_followed_by_word_of_variables.
+
 python3 greibach.py | less -R
 
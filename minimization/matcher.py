@@ -0,0 +1,215 @@
+# Table-driven execution of DFAs over byte buffers.
+
+# A DFA in the dictionary format of min.py (for instance, a minimized
+# automaton built by make_min_afd or regex_to_dfa) is compiled into a
+# dense uint32 transition table with one row per state and one column
+# per byte class: bytes with the same column in the table share a
+# class, and bytes that are not symbols of the automaton lead to a dead
+# state. Symbols must be bytes: integers from 0 to 255, or strings or
+# bytes of length 1.
+
+# Buffers are bytes, bytearrays, memoryviews or mmaps, read through
+# NumPy views without copies. A single input is run by a loop over its
+# byte classes; many inputs (for instance, the lines of a log file) are
+# run together, one byte of every input per step, with NumPy.
+
+import mmap
+import pprint
+import numpy as np
+from min import state_has, states_having
+
+class ByteDFA:
+    '''
+    DFA compiled for bytes. table[q, c] is the successor of state q by
+    the bytes of class c, byte_class[b] is the class of byte b,
+    final[q] tells whether q is final and start is the initial state.
+    '''
+    __slots__ = ("table", "byte_class", "final", "start", "flat")
+
+    def __init__(self, table, byte_class, final, start):
+        self.table = table
+        self.byte_class = byte_class
+        self.final = final
+        self.start = start
+        # Successors premultiplied by the number of classes, so that
+        # the next state of the row at q is flat[q + c].
+        self.flat = (table.astype(np.int64) * table.shape[1]).reshape(-1).tolist()
+
+def symbol_byte(s):
+    if isinstance(s, int) and 0 <= s < 256:
+        return s
+    if isinstance(s, str) and len(s) == 1 and ord(s) < 256:
+        return ord(s)
+    if isinstance(s, bytes) and len(s) == 1:
+        return s[0]
+    raise Exception("Symbol " + repr(s) + " is not a byte")
+
+def compile_dfa(sigma, delta, initial, final):
+    '''
+    Compiles a DFA in the dictionary format into a ByteDFA. States of
+    a minimized automaton may be classes of states, in which case
+    initial and final refer to the states they contain.
+    '''
+    states = list(delta.keys())
+    index = { q : i for i, q in enumerate(states) }
+    n = len(states)
+    dead = n
+    columns = np.full((256, n + 1), dead, dtype=np.uint32)
+    for s in sigma:
+        b = symbol_byte(s)
+        columns[b, :n] = [index[delta[q][s]] for q in states]
+    # Bytes with equal columns are merged into one class.
+    classes = {}
+    byte_class = np.zeros(256, dtype=np.uint8)
+    for b in range(256):
+        byte_class[b] = classes.setdefault(columns[b].tobytes(), len(classes))
+    table = np.empty((n + 1, len(classes)), dtype=np.uint32)
+    for b in range(256):
+        table[:, byte_class[b]] = columns[b]
+    final_flags = np.zeros(n + 1, dtype=bool)
+    final_flags[:n] = np.frombuffer(states_having(states, final), dtype=np.uint8)
+    start = next((i for i, q in enumerate(states) if state_has(q, initial)), None)
+    if start is None:
+        raise ValueError("Initial state " + str(initial) + " is not a state of the automaton")
+    return ByteDFA(table, byte_class, final_flags, start)
+
+def compile_compact(cdfa, initial=0):
+    '''
+    Compiles a CompactDFA, such as the ones built by nfa.py, whose
+    initial state is the state number initial, into a ByteDFA.
+    '''
+    k = len(cdfa.symbols)
+    delta = { i : { s : cdfa.table[i * k + j] for j, s in enumerate(cdfa.symbols) }
+              for i in range(len(cdfa)) }
+    return compile_dfa(cdfa.symbols, delta, initial, [i for i in range(len(cdfa)) if cdfa.final[i]])
+
+def byte_view(data):
+    # Read-only uint8 view of a buffer, without copying it.
+    return np.frombuffer(data, dtype=np.uint8)
+
+def run(m, data, start=0, end=None, state=None, chunk=1 << 20):
+    '''
+    Runs the ByteDFA m over data[start:end], from state (by default,
+    the initial state), and returns the state reached. The buffer is
+    translated to byte classes one chunk at a time.
+    '''
+    view = byte_view(data)[start:end]
+    k = m.table.shape[1]
+    flat = m.flat
+    q = (m.start if state is None else state) * k
+    for i in range(0, len(view), chunk):
+        for c in m.byte_class[view[i:i + chunk]].tolist():
+            q = flat[q + c]
+    return q // k
+
+def accepts(m, data, start=0, end=None):
+    return bool(m.final[run(m, data, start, end)])
+
+def separator_offsets(view, sep):
+    # Offsets of the occurrences of sep in view, from left to right and
+    # without overlaps.
+    if len(sep) == 0:
+        raise ValueError("The record separator is empty")
+    n = len(view) - len(sep) + 1
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    found = view[:n] == sep[0]
+    for j in range(1, len(sep)):
+        found &= view[j:n + j] == sep[j]
+    offsets = np.flatnonzero(found)
+    # Occurrences may only overlap if a proper prefix of sep is also
+    # a suffix of it, as in b"aa".
+    if any(sep[:j] == sep[-j:] for j in range(1, len(sep))):
+        kept = []
+        last = -len(sep)
+        for o in offsets.tolist():
+            if o >= last + len(sep):
+                kept.append(o)
+                last = o
+        offsets = np.array(kept, dtype=np.int64)
+    return offsets
+
+def record_bounds(data, sep=b"\n"):
+    '''
+    Splits data into records ended by the separator sep, a non-empty
+    bytes object such as b"\\n" or b"\\r\\n" (the last record may not
+    be ended by it). Returns the arrays of their start and end offsets,
+    without the separators.
+    '''
+    view = byte_view(data)
+    ends = separator_offsets(view, bytes(sep))
+    starts = np.concatenate(([0], ends + len(sep)))
+    ends = np.concatenate((ends, [len(view)]))
+    if starts[-1] == len(view):
+        starts, ends = starts[:-1], ends[:-1]
+    return starts, ends
+
+def match_records(m, data, starts, ends):
+    '''
+    Runs the ByteDFA m over the records data[starts[i]:ends[i]]
+    together: at step j, every record longer than j moves by its byte
+    j. Records are sorted by decreasing length, so that the records
+    still running at each step are a prefix of the batch.
+    Returns the boolean array of the records that m accepts.
+    '''
+    view = byte_view(data)
+    lengths = np.asarray(ends) - np.asarray(starts)
+    order = np.argsort(-lengths, kind="stable")
+    offsets = np.asarray(starts)[order]
+    lengths = lengths[order]
+    states = np.full(len(order), m.start, dtype=np.uint32)
+    # active[j] is the number of records longer than j.
+    active = np.searchsorted(-lengths, -np.arange(int(lengths[0]) if len(order) else 0), side="left")
+    for j, a in enumerate(active.tolist()):
+        classes = m.byte_class[view[offsets[:a] + j]]
+        states[:a] = m.table[states[:a], classes]
+    result = np.empty(len(order), dtype=bool)
+    result[order] = m.final[states]
+    return result
+
+def match_many(m, strings):
+    '''
+    Runs the ByteDFA m over each of a list of bytes objects, in one
+    batch. Returns the boolean array of the accepted ones.
+    '''
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+    ends = np.cumsum(lengths)
+    return match_records(m, b"".join(strings), ends - lengths, ends)
+
+def scan(m, data, sep=b"\n", batch=1 << 16):
+    '''
+    Yields the (start, end) offsets of the records of data, separated
+    by sep, that the ByteDFA m accepts, running batch records at a
+    time.
+    '''
+    starts, ends = record_bounds(data, sep)
+    for i in range(0, len(starts), batch):
+        s, e = starts[i:i + batch], ends[i:i + batch]
+        for r in np.flatnonzero(match_records(m, data, s, e)).tolist():
+            yield int(s[r]), int(e[r])
+
+def scan_file(m, path, sep=b"\n", batch=1 << 16):
+    '''
+    Memory-maps the file at path and yields the (start, end) offsets of
+    its records accepted by the ByteDFA m, as scan does.
+    '''
+    with open(path, "rb") as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield from scan(m, data, sep, batch)
+
+if __name__ == "__main__":
+    from nfa import regex_to_dfa
+    pp = pprint.PrettyPrinter()
+    sigma, delta, initial, final = regex_to_dfa("(a|b)*abb")
+    m = compile_dfa(sigma, delta, initial, final)
+    print("Byte classes of (a|b)*abb:", sorted(set(m.byte_class.tolist())))
+    pp.pprint(m.table)
+    for w in [b"abb", b"aabb", b"abab", b"xabb"]:
+        print(w, accepts(m, w))
+    lines = b"abb\nbab\nbbabb\n\nabba\n"
+    print([lines[s:e] for s, e in scan(m, lines)])
+    crlf = b"abb\r\nbab\r\nbbabb\r\n"
+    print([crlf[s:e] for s, e in scan(m, crlf, sep=b"\r\n")])
+    print(match_many(m, [b"abb", b"ab", b"babb"]))
@@ -9,10 +9,16 @@
 # so is the set of final states.
 
 # The triangular matrix of potential (non)equivalent states is implemented as a list of state pairs.
+# Without a trace, the table-filling algorithm works on a triangular
+# bytearray indexed by pairs of state numbers instead (see table_fill).
 
+import os
+import sys
 import pandas as pd
+import numpy as np
 from tabulate import tabulate
 import pprint
+from array import array
 #import pygraphviz as pgv
 from graphviz import Digraph
 
@@ -26,55 +32,819 @@ def not_marked(equiv_states, i):
     return equiv_states[i]
 
 def mark_recursive(equiv_states, dep, i):
-    l = dep[i]
-    for p in l:
-        equiv_states[p] = False
-        mark_recursive(equiv_states, dep, p)
-
-def mark_non_trivial(sigma, delta, state_pairs, equiv_states, final):
-    trace = []
-    dep = {i : [] for i in range(len(state_pairs))}
+    '''
+    Marks the pairs in the list headed by i and, transitively, the
+    pairs in the lists headed by them. Uses an explicit worklist and
+    marks each pair only once.
+    '''
+    work = [i]
+    while work:
+        for p in dep[work.pop()]:
+            if not_marked(equiv_states, p):
+                equiv_states[p] = False
+                work.append(p)
+
+def mark_non_trivial_events(sigma, delta, state_pairs, equiv_states, snapshot=True):
+    '''
+    Marks the non-trivially non-equivalent pairs of states, yielding a
+    structured trace event for each action of the algorithm:
+      ("step", i, qu, qv)       pair i = {qu, qv} is examined;
+      ("marked", i, p)          pair i was already marked;
+      ("sigma", s, pu, pv)      qu and qv reach pu and pv by s;
+      ("equal",)                pu == pv;
+      ("append", pu, pv, l)     {qu, qv} is appended to the list l
+                                headed by {pu, pv};
+      ("mark", qu, qv, l)       {qu, qv} and the list l headed by it
+                                are marked.
+    Lists are snapshots of the algorithm's dependency sets, taken when
+    the event is emitted, if snapshot is True, and the live sets
+    otherwise, which saves copying them when the events are not kept.
+    '''
+    dep = [set() for _ in range(len(state_pairs))]
+    pair_index = { frozenset(p) : i for i, p in enumerate(state_pairs) }
     for i, p in enumerate(state_pairs):
         if not_marked(equiv_states,i):
-            trace_step = "Step " + str(i) + "\n"
             l = list(p)
             qu = l[0]
             qv = l[1]
-            trace_step += "qu = " + str(qu) + ", qv = " + str(qv) + "\n"
+            yield ("step", i, qu, qv)
             for s in sigma:
                 pu = delta[qu][s]
                 pv = delta[qv][s]
-                trace_step += "\tSigma = " + str(s) + "\n"
-                trace_step += "\t\tpu = " + str(pu) + ", pv = " + str(pv) + "\n"
+                yield ("sigma", s, pu, pv)
                 if pu == pv:
-                    trace_step += "\t\tpu == pv. Skipping to next sigma. \n"
+                    yield ("equal",)
                     continue
                 else:
-                    pu_pv_idx = state_pairs.index({pu, pv})
+                    pu_pv_idx = pair_index[frozenset((pu, pv))]
                     if not_marked(equiv_states, pu_pv_idx):
-                        trace_step += "\t\tpu != pv, and {pu, pv} not marked. \n"
-                        trace_step += "\t\tAppending {qu, qv} to the list headed by {pu, pv}. \n"
-                        if i not in dep[pu_pv_idx]:
-                            dep[pu_pv_idx].append(i)
-                        trace_step += "\t\tList headed by " + str({pu, pv}) + " = " + \
-                            str([state_pairs[dep[pu_pv_idx][i]] for i in range(len(dep[pu_pv_idx]))]) + "\n"
-                        
+                        dep[pu_pv_idx].add(i)
+                        l = dep[pu_pv_idx]
+                        yield ("append", pu, pv, frozenset(l) if snapshot else l)
                     else:
-                        trace_step += "\t\tpu != pv and {pu, pv} is marked. \n"
-                        trace_step += "\t\tRecursevely marking the list headed by {qu, qv}. \n"
-                        trace_step += "\t\tList headed by " + str({qu, qv}) + " = " + \
-                            str([state_pairs[dep[i][j]] for j in range(len(dep[i]))]) + "\n"
+                        yield ("mark", qu, qv, frozenset(dep[i]) if snapshot else dep[i])
                         equiv_states[i] = False
                         mark_recursive(equiv_states, dep, i)
         else:
-            trace_step = "Step " + str(i) + "\n"
-            trace_step += "Pair " + str(p) + " is marked. Skipping to the next pair.\n"
-        trace.append(trace_step)
-    return trace
+            yield ("marked", i, p)
+
+def render_trace(events, state_pairs):
+    '''
+    Renders the trace events of mark_non_trivial_events, yielding one
+    human-readable string per step.
+    '''
+    trace_step = None
+    for e in events:
+        if e[0] == "step" or e[0] == "marked":
+            if trace_step is not None:
+                yield trace_step
+            trace_step = "Step " + str(e[1]) + "\n"
+            if e[0] == "step":
+                trace_step += "qu = " + str(e[2]) + ", qv = " + str(e[3]) + "\n"
+            else:
+                trace_step += "Pair " + str(e[2]) + " is marked. Skipping to the next pair.\n"
+        elif e[0] == "sigma":
+            trace_step += "\tSigma = " + str(e[1]) + "\n"
+            trace_step += "\t\tpu = " + str(e[2]) + ", pv = " + str(e[3]) + "\n"
+        elif e[0] == "equal":
+            trace_step += "\t\tpu == pv. Skipping to next sigma. \n"
+        elif e[0] == "append":
+            trace_step += "\t\tpu != pv, and {pu, pv} not marked. \n"
+            trace_step += "\t\tAppending {qu, qv} to the list headed by {pu, pv}. \n"
+            trace_step += "\t\tList headed by " + str({e[1], e[2]}) + " = " + \
+                str([state_pairs[j] for j in sorted(e[3])]) + "\n"
+        elif e[0] == "mark":
+            trace_step += "\t\tpu != pv and {pu, pv} is marked. \n"
+            trace_step += "\t\tRecursevely marking the list headed by {qu, qv}. \n"
+            trace_step += "\t\tList headed by " + str({e[1], e[2]}) + " = " + \
+                str([state_pairs[j] for j in sorted(e[3])]) + "\n"
+    if trace_step is not None:
+        yield trace_step
+
+def mark_non_trivial(sigma, delta, state_pairs, equiv_states, final, trace=False):
+    '''
+    Marks the non-trivially non-equivalent pairs of states.
+    Returns the rendered trace of the algorithm if trace is True and
+    an empty list otherwise. Without a trace, the pairs are marked in
+    a triangular table by table_fill.
+    '''
+    if trace:
+        events = mark_non_trivial_events(sigma, delta, state_pairs, equiv_states)
+        return list(render_trace(events, state_pairs))
+    cdfa = make_compact_dfa(sigma, delta, [])
+    index = cdfa.state_index
+    marked = bytearray(pair_count(len(cdfa)))
+    keys = array("q")
+    for i, p in enumerate(state_pairs):
+        k = list(p)
+        keys.append(pair_index(index[k[0]], index[k[1]]))
+        if not equiv_states[i]:
+            marked[keys[i]] = 1
+    table_fill(cdfa, marked)
+    for i, key in enumerate(keys):
+        equiv_states[i] = not marked[key]
+    return []
+
+# The table of pairs of states of a CompactDFA is a triangular bytearray
+# with one 0/1 flag per pair {i, j} of state numbers, at index
+# i * (i - 1) // 2 + j for i > j.
+
+def pair_count(n):
+    return n * (n - 1) // 2
+
+def pair_index(i, j):
+    if i < j:
+        i, j = j, i
+    return i * (i - 1) // 2 + j
+
+def pair_states(keys):
+    # The state numbers i > j of the pairs at the indexes of the NumPy
+    # array keys.
+    i = ((1 + np.sqrt(8 * keys.astype(np.float64) + 1)) // 2).astype(np.int64)
+    i -= i * (i - 1) // 2 > keys
+    i += (i + 1) * i // 2 <= keys
+    return i, keys - i * (i - 1) // 2
+
+def table_fill(cdfa, marked, budget=1 << 20):
+    '''
+    Marks, in the triangular table marked, every pair of states of the
+    CompactDFA cdfa from which some word leads to a marked pair. The
+    marking is driven from the reverse transitions: the pairs marked
+    in a round are the pairs {u, v} with u and v reaching by the same
+    symbol a pair marked in the round before, so each pair is visited
+    once, when it is marked. The pairs are expanded with NumPy, in
+    pieces of about budget predecessor pairs.
+    '''
+    n = len(cdfa)
+    k = len(cdfa.symbols)
+    if n < 2 or k == 0:
+        return
+    # The states that reach state j by s are pred[start[s * n + j]:
+    # start[s * n + j + 1]].
+    keys = (np.frombuffer(cdfa.table, dtype=np.int32).reshape(n, k) +
+            np.arange(k, dtype=np.int64) * n).reshape(-1)
+    pred = np.argsort(keys, kind="stable") // k
+    start = np.concatenate(([0], np.cumsum(np.bincount(keys, minlength=n * k))))
+    table = np.frombuffer(marked, dtype=np.uint8)
+    frontier = np.flatnonzero(table)
+    while frontier.size:
+        found = []
+        n_found = 0
+        for lo in range(0, frontier.size, budget):
+            p, q = pair_states(frontier[lo:lo + budget])
+            for s in range(k):
+                a0 = start[s * n + p]
+                da = start[s * n + p + 1] - a0
+                b0 = start[s * n + q]
+                db = start[s * n + q + 1] - b0
+                counts = da * db
+                live = counts > 0
+                a0, b0, db, counts = a0[live], b0[live], db[live], counts[live]
+                ends = np.cumsum(counts)
+                first = 0
+                while first < counts.size:
+                    last = int(np.searchsorted(ends, ends[first] - counts[first] + budget, "right"))
+                    last = max(last, first + 1)
+                    c = counts[first:last]
+                    offset = np.arange(int(c.sum())) - np.repeat(np.cumsum(c) - c, c)
+                    width = np.repeat(db[first:last], c)
+                    u = pred[np.repeat(a0[first:last], c) + offset // width]
+                    v = pred[np.repeat(b0[first:last], c) + offset % width]
+                    distinct = u != v
+                    u, v = u[distinct], v[distinct]
+                    new = np.maximum(u, v)
+                    new = new * (new - 1) // 2 + np.minimum(u, v)
+                    new = new[table[new] == 0]
+                    table[new] = 2
+                    found.append(new)
+                    n_found += new.size
+                    first = last
+        # The pairs marked in this round are flagged 2, possibly more
+        # than once in found, and are flagged 1 once deduplicated.
+        if 16 * n_found > table.size:
+            frontier = np.flatnonzero(table == 2)
+        elif n_found:
+            frontier = np.sort(np.concatenate(found))
+            frontier = frontier[np.concatenate(([True], frontier[1:] != frontier[:-1]))]
+        else:
+            frontier = np.zeros(0, dtype=np.int64)
+        table[frontier] = 1
+
+def table_classes(cdfa):
+    '''
+    Computes the equivalence classes of the states of a CompactDFA by
+    the table-filling algorithm, on a triangular table of its pairs of
+    states: the pairs of a final and a non-final state are marked, and
+    then the pairs that reach them, by table_fill. Each state joins
+    the class of the first state before it that it is not marked with.
+    Returns an int32 array mapping each state to its class and the
+    number of classes.
+    '''
+    n = len(cdfa)
+    final = np.frombuffer(bytes(cdfa.final), dtype=np.uint8)
+    marked = bytearray(pair_count(n))
+    table = np.frombuffer(marked, dtype=np.uint8)
+    for i in range(1, n):
+        table[pair_index(i, 0):pair_index(i, 0) + i] = final[:i] != final[i]
+    table_fill(cdfa, marked)
+    class_of = array("i", [0] * n)
+    n_classes = 0
+    for i in range(n):
+        row = table[pair_index(i, 0):pair_index(i, 0) + i]
+        j = int(np.argmin(row)) if i else 0
+        if i and row[j] == 0:
+            class_of[i] = class_of[j]
+        else:
+            class_of[i] = n_classes
+            n_classes += 1
+    return class_of, n_classes
+
+class CompactDFA:
+    '''
+    Deterministic automaton whose states and symbols are interned to
+    dense integers. The transition function is a row-major int32 array
+    with one row of len(symbols) entries per state, and final is a
+    bytearray with one 0/1 flag per state.
+    '''
+    __slots__ = ("states", "symbols", "state_index", "symbol_index", "table", "final")
+
+    def __init__(self, states, symbols, table, final):
+        self.states = states
+        self.symbols = symbols
+        self.state_index = { q : i for i, q in enumerate(states) }
+        self.symbol_index = { s : i for i, s in enumerate(symbols) }
+        self.table = table
+        self.final = final
+
+    def __len__(self):
+        return len(self.states)
+
+    def step(self, i, s):
+        return self.table[i * len(self.symbols) + s]
+
+def make_compact_dfa(sigma, delta, final):
+    '''
+    Converts an automaton in the dictionary format into a CompactDFA.
+    '''
+    states = list(delta.keys())
+    symbols = list(sigma)
+    index = { q : i for i, q in enumerate(states) }
+    table = array("i", [index[delta[q][s]] for q in states for s in symbols])
+    final_flags = bytearray(len(states))
+    for f in final:
+        if f in index:
+            final_flags[index[f]] = 1
+    return CompactDFA(states, symbols, table, final_flags)
+
+def compact_to_dfa(cdfa):
+    '''
+    Converts a CompactDFA back into the dictionary format.
+    Returns sigma, delta and final.
+    '''
+    states = cdfa.states
+    symbols = cdfa.symbols
+    k = len(symbols)
+    table = cdfa.table
+    delta = { q : { s : states[table[i * k + j]] for j, s in enumerate(symbols) }
+              for i, q in enumerate(states) }
+    final = [q for i, q in enumerate(states) if cdfa.final[i]]
+    return set(symbols), delta, final
+
+def hopcroft_classes(cdfa, initial=None):
+    '''
+    Computes the equivalence classes of the states of a CompactDFA by
+    Hopcroft's partition refinement algorithm, in O(n.|sigma|.log n)
+    time, where n is the number of states. initial, if given, maps
+    each state to an initial class, which refines final and non-final
+    states, as the token accepted by each state of a lexer.
+    Returns an int32 array mapping each state to its class and the
+    number of classes.
+    '''
+    n = len(cdfa.states)
+    k = len(cdfa.symbols)
+    table = cdfa.table
+    # The states that reach state j by s are pred[start[s * n + j]:
+    # start[s * n + j + 1]]: the transitions counting-sorted by symbol
+    # and target, in flat int32 arrays.
+    keys = (np.frombuffer(table, dtype=np.int32).reshape(n, k) +
+            np.arange(k, dtype=np.int64) * n).reshape(-1) if n * k else np.zeros(0, dtype=np.int64)
+    pred = array("i", (np.argsort(keys, kind="stable") // max(k, 1)).astype(np.int32).tobytes())
+    start = array("i", np.concatenate(([0], np.cumsum(np.bincount(keys, minlength=n * k))))
+                  .astype(np.int32).tobytes())
+    groups = {}
+    for i in range(n):
+        key = cdfa.final[i] if initial is None else (cdfa.final[i], initial[i])
+        groups.setdefault(key, set()).add(i)
+    blocks = list(groups.values())
+    block_of = array("i", [0] * n)
+    for b, block in enumerate(blocks):
+        for i in block:
+            block_of[i] = b
+    # Splitters are pairs (block, symbol), encoded as block * k + symbol
+    # in a flat work list, with a flag per pair telling whether it is in
+    # the list. There are at most n blocks. Initially, all the blocks
+    # but the largest one need to be used as splitters.
+    work = array("i")
+    in_work = bytearray(n * k)
+    if len(blocks) > 1:
+        largest = max(range(len(blocks)), key=lambda b: len(blocks[b]))
+        work.extend(b * k + s for b in range(len(blocks)) if b != largest for s in range(k))
+    for w in work:
+        in_work[w] = 1
+    while work:
+        w = work.pop()
+        in_work[w] = 0
+        a, s = divmod(w, k)
+        # States that reach the splitter block by s, grouped by block.
+        touched = {}
+        base = s * n
+        for j in blocks[a]:
+            for p in range(start[base + j], start[base + j + 1]):
+                i = pred[p]
+                touched.setdefault(block_of[i], set()).add(i)
+        for b, x in touched.items():
+            if len(x) == len(blocks[b]):
+                continue
+            # Block b is split into x and the remaining states.
+            blocks[b] -= x
+            new = len(blocks)
+            blocks.append(x)
+            for i in x:
+                block_of[i] = new
+            smaller = new if len(x) <= len(blocks[b]) else b
+            for t in range(k):
+                pending = new * k + t if in_work[b * k + t] else smaller * k + t
+                work.append(pending)
+                in_work[pending] = 1
+    return block_of, len(blocks)
+
+def compact_quotient(cdfa, class_of, n_classes):
+    '''
+    Builds the quotient CompactDFA of cdfa under the given classes.
+    Each state of the quotient is labeled by the frozenset of the
+    states of its class.
+    '''
+    k = len(cdfa.symbols)
+    table = cdfa.table
+    members = [[] for _ in range(n_classes)]
+    for i, c in enumerate(class_of):
+        members[c].append(cdfa.states[i])
+    new_table = array("i", [0] * (n_classes * k))
+    new_final = bytearray(n_classes)
+    seen = bytearray(n_classes)
+    for i, c in enumerate(class_of):
+        if seen[c]:
+            continue
+        seen[c] = 1
+        new_final[c] = cdfa.final[i]
+        for s in range(k):
+            new_table[c * k + s] = class_of[table[i * k + s]]
+    return CompactDFA([frozenset(m) for m in members], list(cdfa.symbols), new_table, new_final)
+
+def moore_classes(cdfa):
+    '''
+    Computes the equivalence classes of the states of a CompactDFA by
+    Moore's refinement, vectorized with NumPy. At each round, the
+    signature of a state is its current class followed by the classes
+    of its successors, and states are re-partitioned by their
+    signatures with np.unique over rows.
+    Returns an int32 array mapping each state to its class and the
+    number of classes.
+    '''
+    n = len(cdfa.states)
+    k = len(cdfa.symbols)
+    if n == 0:
+        return array("i"), 0
+    table = np.frombuffer(cdfa.table, dtype=np.int32).reshape(n, k)
+    classes = np.frombuffer(bytes(cdfa.final), dtype=np.uint8).astype(np.int32)
+    _, classes = np.unique(classes, return_inverse=True)
+    n_classes = int(classes.max()) + 1
+    while True:
+        signatures = np.column_stack((classes, classes[table]))
+        _, new_classes = np.unique(signatures, axis=0, return_inverse=True)
+        new_classes = new_classes.reshape(-1)
+        new_n_classes = int(new_classes.max()) + 1
+        classes = new_classes
+        if new_n_classes == n_classes:
+            break
+        n_classes = new_n_classes
+    return array("i", classes.astype(np.int32).tobytes()), n_classes
+
+def min(sigma, delta, state_pairs, equiv_states, final, method="table", trace=False):
+    '''
+    Marks in equiv_states the pairs of non-equivalent states.
+    The method is either "table" (the table-filling algorithm, which
+    returns its trace when trace is True), "hopcroft" or "moore"
+    (which return an empty trace).
+    '''
+    if method == "table" and trace:
+        mark_trivial(state_pairs, equiv_states, final)
+        return mark_non_trivial(sigma, delta, state_pairs, equiv_states, final, trace)
+    cdfa = make_compact_dfa(sigma, delta, final)
+    if method == "table":
+        class_of, _ = table_classes(cdfa)
+    elif method == "hopcroft":
+        class_of, _ = hopcroft_classes(cdfa)
+    elif method == "moore":
+        class_of, _ = moore_classes(cdfa)
+    else:
+        raise Exception("Unknown minimization method " + str(method))
+    index = cdfa.state_index
+    for i, p in enumerate(state_pairs):
+        k = list(p)
+        equiv_states[i] = class_of[index[k[0]]] == class_of[index[k[1]]]
+    return []
+
+def hopcroft(sigma, delta, final):
+    '''
+    Computes the partition of the states of the automaton into
+    equivalence classes with Hopcroft's algorithm.
+    Returns a list of frozensets of states.
+    '''
+    cdfa = make_compact_dfa(sigma, delta, final)
+    class_of, n_classes = hopcroft_classes(cdfa)
+    return compact_quotient(cdfa, class_of, n_classes).states
+
+def hopcroft_min(sigma, delta, final):
+    '''
+    Minimizes the automaton with Hopcroft's algorithm.
+    Returns the partition of the states and the transition function
+    of the minimized automaton, in the format of make_min_afd.
+    '''
+    cdfa = make_compact_dfa(sigma, delta, final)
+    class_of, n_classes = hopcroft_classes(cdfa)
+    min_cdfa = compact_quotient(cdfa, class_of, n_classes)
+    _, new_delta, _ = compact_to_dfa(min_cdfa)
+    return min_cdfa.states, new_delta
+
+FP_MULT = 0x9E3779B97F4A7C15
+FP_MASK = (1 << 64) - 1
+
+def mix_hash(final, hashes):
+    '''
+    Hash of a node from its finality and the hashes of its successors,
+    in 64-bit arithmetic, as fingerprint_table computes it.
+    '''
+    x = int(final) + 1
+    for h in hashes:
+        x = (x * FP_MULT + h) & FP_MASK
+    return x ^ (x >> 31)
+
+def fingerprints(node_final, node_succ, known, depth):
+    '''
+    Computes, for each node, the tuple of the hashes h_0, ..., h_(depth-1)
+    where h_0 is the hash of its finality and h_t the hash of its
+    finality and of the h_(t-1) of its successors. Equivalent nodes have
+    equal fingerprints. known gives the fingerprints of the successors
+    that are not in node_succ.
+    '''
+    fp = { x : [mix_hash(node_final[x], ())] for x in node_succ }
+    for t in range(1, depth):
+        for x, succ in node_succ.items():
+            fp[x].append(mix_hash(node_final[x],
+                                  [known[d][t - 1] if d in known else fp[d][t - 1] for d in succ]))
+    return { x : tuple(h) for x, h in fp.items() }
+
+def fingerprint_table(final, table, depth):
+    '''
+    Computes the fingerprints of all the states of an automaton at
+    once, with NumPy, from its uint8 array of final flags and its (n, k)
+    array of transitions. Returns an (n, depth) uint64 array whose rows
+    are the fingerprints, as fingerprints computes them.
+    '''
+    n, k = table.shape
+    x0 = final.astype(np.uint64) + np.uint64(1)
+    h = x0 ^ (x0 >> np.uint64(31))
+    levels = [h]
+    for _ in range(1, depth):
+        x = x0.copy()
+        for a in range(k):
+            x = x * np.uint64(FP_MULT) + h[table[:, a]]
+        h = x ^ (x >> np.uint64(31))
+        levels.append(h)
+    return np.stack(levels, axis=1) if n else np.zeros((0, depth), dtype=np.uint64)
 
-def min(sigma, delta, state_pairs, equiv_states, final):
-    mark_trivial(state_pairs, equiv_states, final)
-    return mark_non_trivial(sigma, delta, state_pairs, equiv_states, final)
+class IncrementalMinimizer:
+    '''
+    Keeps the minimization of a total DFA up to date under edits of its
+    states, transitions and final states. The partition is refined
+    lazily, when it is queried, and only around the edited states:
+    the states whose language may have changed are those that reach
+    an edited state (the set R). The states of R equivalent to a class
+    outside R are found by a simultaneous walk from the classes with
+    the same fingerprint, a hash of the finality of the states reached
+    by the words of length less than depth. Hopcroft's algorithm is run
+    on the other states of R only, with the classes outside R as fixed
+    labels of their transitions, so that a refinement takes time in
+    proportion to |R|.|sigma|. Classes of the states outside R do not
+    change. When R holds more than full_fraction of the states, the
+    whole automaton is minimized again instead, which is faster.
+    '''
+    depth = 8
+    full_fraction = 0.25
+
+    def __init__(self, sigma, delta, final):
+        self.symbols = list(sigma)
+        self.column = { s : a for a, s in enumerate(self.symbols) }
+        self.names = list(delta.keys())
+        self.index = { q : i for i, q in enumerate(self.names) }
+        self.delta = [[self.index[delta[q][s]] for s in self.symbols] for q in self.names]
+        final = set(final)
+        self.final = [q in final for q in self.names]
+        # pred[j] counts, for each state i, the transitions from i to j.
+        self.pred = [{} for _ in self.names]
+        for i, row in enumerate(self.delta):
+            for j in row:
+                self.pred[j][i] = self.pred[j].get(i, 0) + 1
+        self.alive = [True] * len(self.names)
+        self.n_alive = len(self.names)
+        self.dirty = set()
+        self.next_class = 0
+        self.rebuild()
+
+    def rebuild(self):
+        '''
+        Minimizes the whole automaton with Hopcroft's algorithm, and
+        recomputes the classes and their fingerprints.
+        '''
+        live = [i for i, a in enumerate(self.alive) if a]
+        pos = { i : n for n, i in enumerate(live) }
+        k = len(self.symbols)
+        table = array("i", [pos[j] for i in live for j in self.delta[i]])
+        cdfa = CompactDFA([self.names[i] for i in live], self.symbols, table,
+                          bytearray(self.final[i] for i in live))
+        local, n_classes = hopcroft_classes(cdfa)
+        # Per class: finality, successor classes and fingerprint, and
+        # the index of classes by fingerprint.
+        base = self.new_class_ids(n_classes)
+        local = np.frombuffer(local, dtype=np.int32)
+        _, first = np.unique(local, return_index=True)
+        rows = np.frombuffer(table, dtype=np.int32).reshape(len(live), k)
+        class_succ = local[rows[first]] if len(live) else np.zeros((0, k), dtype=np.int32)
+        class_final = np.frombuffer(bytes(cdfa.final), dtype=np.uint8)[first]
+        fp = fingerprint_table(class_final, class_succ, self.depth)
+        self.class_of = [None] * len(self.names)
+        self.members = { base + c : set() for c in range(n_classes) }
+        for i, c in zip(live, local.tolist()):
+            self.class_of[i] = base + c
+            self.members[base + c].add(i)
+        self.class_final = {}
+        self.class_succ = {}
+        self.fingerprint = {}
+        self.by_fingerprint = {}
+        for c, (final, succ, h) in enumerate(zip(class_final.tolist(), class_succ.tolist(),
+                                                 fp.tolist())):
+            self.add_class(base + c, bool(final), tuple(base + d for d in succ), tuple(h))
+
+    def add_class(self, c, final, succ, fingerprint):
+        self.class_final[c] = final
+        self.class_succ[c] = succ
+        self.fingerprint[c] = fingerprint
+        self.by_fingerprint.setdefault(fingerprint[-1], set()).add(c)
+
+    def remove_class(self, c):
+        del self.class_succ[c], self.class_final[c]
+        fingerprint = self.fingerprint.pop(c)
+        del self.members[c]
+        self.by_fingerprint[fingerprint[-1]].discard(c)
+
+    def state(self, q):
+        i = self.index.get(q)
+        if i is None or not self.alive[i]:
+            raise Exception("Unknown state " + str(q))
+        return i
+
+    def add_state(self, q, transitions, final=False):
+        '''
+        Adds state q, whose transitions are given by a dictionary from
+        each symbol to a state, which may be q itself.
+        '''
+        if q in self.index and self.alive[self.index[q]]:
+            raise Exception("State " + str(q) + " already exists")
+        i = len(self.names)
+        self.names.append(q)
+        self.index[q] = i
+        self.alive.append(True)
+        self.n_alive += 1
+        self.final.append(final)
+        self.pred.append({})
+        self.delta.append([i if transitions[s] == q else self.state(transitions[s])
+                           for s in self.symbols])
+        for j in self.delta[i]:
+            self.pred[j][i] = self.pred[j].get(i, 0) + 1
+        # A new state is a class of its own until the next refinement.
+        c = self.new_class_ids(1)
+        self.class_of.append(c)
+        self.members[c] = {i}
+        self.class_final[c] = final
+        self.class_succ[c] = None
+        self.dirty.add(i)
+
+    def remove_state(self, q):
+        '''
+        Removes state q, which must not be the target of transitions of
+        other states.
+        '''
+        i = self.state(q)
+        if any(j != i for j in self.pred[i]):
+            raise Exception("State " + str(q) + " is the target of other states")
+        for j in self.delta[i]:
+            self.pred[j].pop(i, None)
+        self.alive[i] = False
+        self.n_alive -= 1
+        self.detach(i)
+        self.dirty.discard(i)
+        del self.index[q]
+
+    def set_transition(self, q, s, r):
+        i = self.state(q)
+        j = self.state(r)
+        a = self.column.get(s)
+        if a is None:
+            raise Exception("Unknown symbol " + str(s))
+        old = self.delta[i][a]
+        self.pred[old][i] -= 1
+        if self.pred[old][i] == 0:
+            del self.pred[old][i]
+        self.delta[i][a] = j
+        self.pred[j][i] = self.pred[j].get(i, 0) + 1
+        self.dirty.add(i)
+
+    def set_final(self, q, final=True):
+        i = self.state(q)
+        self.final[i] = final
+        self.dirty.add(i)
+
+    def new_class_ids(self, n):
+        # Returns the first of n fresh class ids.
+        c = self.next_class
+        self.next_class += n
+        return c
+
+    def detach(self, i):
+        # Removes state i from its class, removing the class if empty.
+        c = self.class_of[i]
+        self.members[c].discard(i)
+        if self.members[c] == set():
+            if self.class_succ[c] is None:
+                del self.members[c], self.class_final[c], self.class_succ[c]
+            else:
+                self.remove_class(c)
+
+    def refine(self):
+        if not self.dirty:
+            return
+        # R is the set of the states that reach an edited state.
+        edited = list(self.dirty)
+        r_states = set(edited)
+        work = list(r_states)
+        while work:
+            for i in self.pred[work.pop()]:
+                if i not in r_states:
+                    r_states.add(i)
+                    work.append(i)
+        self.dirty = set()
+        if len(r_states) > self.full_fraction * self.n_alive:
+            self.rebuild()
+            return
+        for i in r_states:
+            self.detach(i)
+        # States of R equivalent to a class outside R are matched with
+        # it by a walk from a class with the same fingerprint. Such a
+        # state only reaches states of R that are matched as well, so
+        # the states that reach a state that cannot be matched are not
+        # tried, nor fingerprinted. Edited states are tried first, as
+        # every state of R reaches one of them.
+        resolved = {}
+        unmatched = set()
+        memo = {}
+        for i in edited + list(r_states):
+            if i in resolved or i in unmatched:
+                continue
+            h = self.state_hash(i, self.depth - 1, r_states, memo)
+            for c in self.by_fingerprint.get(h, ()):
+                mapping = self.walk(i, c, r_states, resolved)
+                if mapping is not None:
+                    resolved.update(mapping)
+                    break
+            else:
+                unmatched.add(i)
+                work = [i]
+                while work:
+                    for j in self.pred[work.pop()]:
+                        if j not in unmatched:
+                            unmatched.add(j)
+                            work.append(j)
+        # The other states of R are not equivalent to any class outside
+        # R, so their classes are the blocks of Hopcroft's algorithm on
+        # them alone, starting from blocks of states with the same
+        # finality and the same classes of successors outside them.
+        # Transitions that leave them become loops, which the initial
+        # blocks account for.
+        rest = [i for i in r_states if i not in resolved]
+        index = { i : n for n, i in enumerate(rest) }
+        table = array("i")
+        keys = []
+        for n, i in enumerate(rest):
+            key = []
+            for j in self.delta[i]:
+                if j in index:
+                    table.append(index[j])
+                    key.append(-1)
+                else:
+                    table.append(n)
+                    key.append(self.target_class(j, r_states, resolved))
+            keys.append(tuple(key))
+        cdfa = CompactDFA(rest, self.symbols, table, bytearray(self.final[i] for i in rest))
+        block_of, n_blocks = hopcroft_classes(cdfa, keys)
+        base = self.new_class_ids(n_blocks)
+        for n, i in enumerate(rest):
+            resolved[i] = base + block_of[n]
+        # The new classes are fingerprinted as a whole, from the
+        # fingerprints of the classes outside R.
+        new_final = {}
+        new_succ = {}
+        for i in rest:
+            c = resolved[i]
+            if c not in new_succ:
+                new_final[c] = self.final[i]
+                new_succ[c] = tuple(self.target_class(j, r_states, resolved) for j in self.delta[i])
+        fp = fingerprints(new_final, new_succ, self.fingerprint, self.depth)
+        for c in new_succ:
+            self.members[c] = set()
+            self.add_class(c, new_final[c], new_succ[c], fp[c])
+        for i in r_states:
+            c = resolved[i]
+            self.class_of[i] = c
+            self.members[c].add(i)
+
+    def state_hash(self, i, t, r_states, memo):
+        '''
+        Returns h_t of the fingerprint of state i of R, from the
+        fingerprints of the classes outside R, computing only the
+        hashes it depends on.
+        '''
+        h = memo.get((i, t))
+        if h is None:
+            if t == 0:
+                h = mix_hash(self.final[i], ())
+            else:
+                h = mix_hash(self.final[i],
+                             [self.state_hash(j, t - 1, r_states, memo) if j in r_states
+                              else self.fingerprint[self.class_of[j]][t - 1]
+                              for j in self.delta[i]])
+            memo[(i, t)] = h
+        return h
+
+    def target_class(self, j, r_states, resolved):
+        return resolved[j] if j in r_states else self.class_of[j]
+
+    def walk(self, i, c, r_states, resolved):
+        '''
+        Walks from state i of R and class c simultaneously. Returns the
+        mapping of the unresolved states of R reached to the classes
+        reached with them if it is consistent, which proves that they
+        are equivalent, or None.
+        '''
+        mapping = { i : c }
+        work = [i]
+        while work:
+            x = work.pop()
+            y = mapping[x]
+            if self.final[x] != self.class_final[y]:
+                return None
+            for j, e in zip(self.delta[x], self.class_succ[y]):
+                if j not in r_states:
+                    if self.class_of[j] != e:
+                        return None
+                elif j in resolved:
+                    if resolved[j] != e:
+                        return None
+                elif j in mapping:
+                    if mapping[j] != e:
+                        return None
+                else:
+                    mapping[j] = e
+                    work.append(j)
+        return mapping
+
+    def partition(self):
+        '''
+        Returns the list of the equivalence classes of the states, as
+        frozensets of states.
+        '''
+        self.refine()
+        return [frozenset(self.names[i] for i in m) for m in self.members.values()]
+
+    def min_delta(self):
+        '''
+        Returns the transition function of the minimized automaton, in
+        the format of make_min_afd.
+        '''
+        self.refine()
+        label = { c : frozenset(self.names[i] for i in m) for c, m in self.members.items() }
+        return { label[c] : { s : label[d] for s, d in zip(self.symbols, self.class_succ[c]) }
+                 for c in self.members }
 
 def make_state_pairs(states):
     state_pairs = []
@@ -83,34 +853,180 @@ def make_state_pairs(states):
             state_pairs.append({s, q})
     return state_pairs
 
+def find_root(parent, i):
+    # Union-find lookup with path halving.
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
 def make_min_afd(states, equiv_states, delta):
-    new_states = { s : set(s) for s in states }
-    for s in states:
-        for t in equiv_states:
-            if t.intersection(set(s)) != set():
-                new_states[s] = t.union(new_states[s])
-    new_states = list(set([frozenset(e) for k, e in new_states.items()]))
-    # print(new_states)
-    new_graph = {s : {0 : z, 1 : o}
-                 for s in new_states
-                 for z in new_states
-                 for o in new_states if delta[list(s)[0]][0] in z and delta[list(s)[0]][1] in o}
-    # print(new_graph)
+    '''
+    Builds the minimized automaton from the list of pairs of equivalent
+    states. The pairs are merged with a union-find over the states, and
+    the transition function of the quotient is emitted from the class
+    of each state in O(n.|sigma|) time, for any alphabet.
+    '''
+    sigma = list(delta[states[0]].keys()) if states else []
+    cdfa = make_compact_dfa(sigma, { q : delta[q] for q in states }, [])
+    index = cdfa.state_index
+    parent = list(range(len(states)))
+    for p in equiv_states:
+        k = list(p)
+        ru = find_root(parent, index[k[0]])
+        rv = find_root(parent, index[k[1]])
+        if ru != rv:
+            parent[ru] = rv
+    class_ids = {}
+    class_of = array("i", [0] * len(states))
+    for i in range(len(states)):
+        class_of[i] = class_ids.setdefault(find_root(parent, i), len(class_ids))
+    min_cdfa = compact_quotient(cdfa, class_of, len(class_ids))
+    _, new_graph, _ = compact_to_dfa(min_cdfa)
     return new_graph
 
 def make_digraph(sigma, initial, d, final):
+    '''
+    Builds the Graphviz graph of a minimized automaton, with a single
+    edge between two states labeled by the symbol_ranges of all the
+    symbols between them.
+    '''
     g = Digraph(format='png')
     g.node("qi", shape="point")
+    name = { s : str(set(s)) for s in d }
+    final = set(final)
     for s in d.keys():
         if initial in s:
-            g.edge("qi", str(set(s)))
-        for f in final:
-            if f in s:
-                g.node(str(set(s)), shape="doublecircle")
+            g.edge("qi", name[s])
+        if not final.isdisjoint(s):
+            g.node(name[s], shape="doublecircle")
+        targets = {}
         for sym in sigma:
-            g.edge(str(set(s)), str(set(d[s][sym])), label=str(sym))
+            targets.setdefault(d[s][sym], []).append(sym)
+        for t, symbols in targets.items():
+            g.edge(name[s], name[t], label=symbol_ranges(symbols))
     return g
 
+def state_label(s):
+    if isinstance(s, (set, frozenset)):
+        return "{" + ", ".join(sorted(str(q) for q in s)) + "}"
+    return str(s)
+
+def state_has(s, q):
+    # Whether state s is q or, for states of a minimized automaton,
+    # a class containing q.
+    return s == q or (isinstance(s, (set, frozenset)) and q in s)
+
+def states_having(states, qs):
+    '''
+    Returns a bytearray with, for each state s of states, 1 if
+    state_has(s, q) for some q in qs and 0 otherwise.
+    '''
+    qs = set(qs)
+    def has(s):
+        if isinstance(s, (set, frozenset)):
+            return not qs.isdisjoint(s) or (isinstance(s, frozenset) and s in qs)
+        return s in qs
+    return bytearray(has(s) for s in states)
+
+def symbol_ranges(symbols):
+    '''
+    Renders a list of symbols as a comma-separated label, where runs of
+    at least three consecutive integers or characters become ranges.
+    The characters ',', '-' and '\\' of the symbols are escaped by a
+    '\\', so that the label can be read back.
+    '''
+    def text(x):
+        return str(x).replace("\\", "\\\\").replace(",", "\\,").replace("-", "\\-")
+
+    def code(x):
+        if isinstance(x, int):
+            return x
+        if isinstance(x, str) and len(x) == 1:
+            return ord(x)
+        return None
+    symbols = sorted(symbols, key=lambda x: (type(x).__name__, code(x) is None, code(x) or 0, str(x)))
+    parts = []
+    i = 0
+    while i < len(symbols):
+        j = i
+        if code(symbols[i]) is not None:
+            while (j + 1 < len(symbols) and type(symbols[j + 1]) == type(symbols[i]) and
+                   code(symbols[j + 1]) == code(symbols[j]) + 1):
+                j += 1
+        if j - i >= 2:
+            parts.append(text(symbols[i]) + "-" + text(symbols[j]))
+        else:
+            parts.extend(text(x) for x in symbols[i:j + 1])
+        i = j + 1
+    return ",".join(parts)
+
+def dot_quote(s):
+    return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def write_dot(path, sigma, initial, d, final, max_nodes=None):
+    '''
+    Streams the automaton to the DOT file at path. Nodes get compact
+    ids n0, n1, ... in breadth-first order from the initial state, and
+    all the symbols between two states are merged into a single edge
+    labeled by symbol ranges. If max_nodes is given, only the first
+    max_nodes states are drawn and the others are clustered into a
+    single node. d may be in the dictionary format or a CompactDFA.
+    '''
+    if isinstance(d, CompactDFA):
+        cdfa = d
+    else:
+        cdfa = make_compact_dfa(sigma, d, [])
+    states = cdfa.states
+    n = len(states)
+    k = len(cdfa.symbols)
+    table = cdfa.table
+    is_final = states_having(states, final)
+    for i in range(n):
+        is_final[i] |= cdfa.final[i]
+    start = [i for i, s in enumerate(states) if state_has(s, initial)]
+    # Breadth-first numbering; unreachable states come last.
+    node_id = array("i", [-1] * n)
+    order = []
+    for root in start + list(range(n)):
+        if node_id[root] != -1:
+            continue
+        node_id[root] = len(order)
+        order.append(root)
+        head = len(order) - 1
+        while head < len(order):
+            i = order[head]
+            head += 1
+            for j in range(k):
+                t = table[i * k + j]
+                if node_id[t] == -1:
+                    node_id[t] = len(order)
+                    order.append(t)
+    budget = n if max_nodes is None else max_nodes
+    with open(path, "w") as out:
+        out.write("digraph {\n")
+        out.write("\tqi [shape=point];\n")
+        for i in order[:budget]:
+            shape = "doublecircle" if is_final[i] else "circle"
+            out.write("\tn" + str(node_id[i]) + " [label=" + dot_quote(state_label(states[i])) +
+                      ", shape=" + shape + "];\n")
+        if budget < n:
+            out.write("\trest [label=" + dot_quote(str(n - budget) + " more states") +
+                      ", shape=box, style=dashed];\n")
+        for i in start:
+            if node_id[i] < budget:
+                out.write("\tqi -> n" + str(node_id[i]) + ";\n")
+        for i in order[:budget]:
+            targets = {}
+            for j in range(k):
+                t = table[i * k + j]
+                target = "n" + str(node_id[t]) if node_id[t] < budget else "rest"
+                targets.setdefault(target, []).append(cdfa.symbols[j])
+            for target, symbols in targets.items():
+                out.write("\tn" + str(node_id[i]) + " -> " + target +
+                          " [label=" + dot_quote(symbol_ranges(symbols)) + "];\n")
+        out.write("}\n")
+
 if __name__ == "__main__":
     # states = ["q0", "A", "NA", "AandB", "NAandB", "AandNB", "NAandNB", "d"]
     # state_pairs = make_state_pairs(states)
@@ -197,7 +1113,7 @@ if __name__ == "__main__":
     }
     sigma4 = {0, 1}
     equiv_states_bool4 = [True] * len(state_pairs4)
-    trace4 = min(sigma4, delta4, state_pairs4, equiv_states_bool4, final4)
+    trace4 = min(sigma4, delta4, state_pairs4, equiv_states_bool4, final4, trace=True)
     equiv_states4 = [p for i, p in enumerate(state_pairs4) if equiv_states_bool4[i] == True]
 
     print("2020.1 - Avaliação Minimização AFD - Questão 2")
@@ -212,8 +1128,18 @@ if __name__ == "__main__":
     for src in delta4.keys():
         for sym in sigma4:
             orig_graph.edge(src, delta4[src][sym], label=str(sym))
-    orig_graph.render("questao2-aut")
+    # If the environment variable FLA_CACHE_DIR is set, images are
+    # rendered through the cache in that directory, which only runs
+    # Graphviz for graphs it has not rendered before.
+    if "FLA_CACHE_DIR" in os.environ:
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache"))
+        import cache
+        image_cache = cache.default_cache()
+        render = lambda graph, filename: cache.render(image_cache, graph, filename)
+    else:
+        render = lambda graph, filename: graph.render(filename)
+    render(orig_graph, "questao2-aut")
         
     min_graph = make_digraph(sigma4, initial4, make_min_afd(states4, equiv_states4, delta4), final4)
-    min_graph.render("questao2-aut-min")
+    render(min_graph, "questao2-aut-min")
     
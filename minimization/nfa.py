@@ -0,0 +1,435 @@
+# Construction of minimal DFAs from regular expressions.
+
+# A regular expression is parsed into a syntax tree, from which the
+# Glushkov (position) automaton is built: an NFA without epsilon
+# transitions whose states are the initial state 0 and the positions
+# 1, 2, ... of the symbols in the expression. Sets of states are
+# integer bitsets, so that the subset construction computes each move
+# with a few bitwise operations and interns each set of states in a
+# dictionary.
+
+# The DFA is built as a CompactDFA (see min.py) and is minimized either
+# by Hopcroft's algorithm or by Brzozowski's double reversal, which
+# never builds the DFA of the expression itself. For lexers, the
+# reversal starts from the final positions of each expression apart,
+# so that the tokens are kept. The result can be
+# converted into the dictionary format of min.py by compact_to_dfa.
+
+# Syntax: | (union), concatenation, *, + and ? (repetitions), (...),
+# [...] and [^...] (character classes, with ranges a-z), . (any
+# symbol) and \ (escapes the next character). The empty expression
+# denotes the empty word.
+
+import pprint
+from array import array
+from min import CompactDFA, hopcroft_classes, compact_to_dfa
+
+def parse_regex(regex, sigma=None):
+    '''
+    Parses regex into a syntax tree of tuples ("empty",), ("sym",
+    chars), ("cat", items), ("alt", items), ("star", x), ("plus", x)
+    and ("opt", x), where chars is a frozenset of symbols. sigma is
+    the alphabet, needed for . and negated classes.
+    '''
+    pos = 0
+
+    def peek():
+        return regex[pos] if pos < len(regex) else None
+
+    def any_symbol():
+        if sigma is None:
+            raise Exception("The alphabet is needed for . and [^...] in " + regex)
+        return frozenset(sigma)
+
+    def parse_class():
+        nonlocal pos
+        negated = peek() == "^"
+        if negated:
+            pos += 1
+        chars = set()
+        first = True
+
+        def class_char():
+            # Reads a symbol of the class, which may be escaped.
+            nonlocal pos
+            if peek() == "\\":
+                pos += 1
+            if peek() is None:
+                raise Exception("Unterminated class in " + regex)
+            pos += 1
+            return regex[pos - 1]
+
+        while peek() != "]" or first:
+            if peek() is None:
+                raise Exception("Unterminated class in " + regex)
+            c = class_char()
+            if peek() == "-" and pos + 1 < len(regex) and regex[pos + 1] != "]":
+                pos += 1
+                hi = class_char()
+                if ord(hi) < ord(c):
+                    raise Exception("Bad range in " + regex)
+                chars.update(chr(x) for x in range(ord(c), ord(hi) + 1))
+            else:
+                chars.add(c)
+            first = False
+        pos += 1
+        return frozenset(any_symbol() - chars) if negated else frozenset(chars)
+
+    def parse_atom():
+        nonlocal pos
+        c = regex[pos]
+        pos += 1
+        if c == "(":
+            tree = parse_alt()
+            if peek() != ")":
+                raise Exception("Missing ) in " + regex)
+            pos += 1
+            return tree
+        if c == "[":
+            return ("sym", parse_class())
+        if c == ".":
+            return ("sym", any_symbol())
+        if c == "\\":
+            if pos == len(regex):
+                raise Exception("Dangling \\ in " + regex)
+            c = regex[pos]
+            pos += 1
+        return ("sym", frozenset(c))
+
+    def parse_cat():
+        nonlocal pos
+        items = []
+        while peek() is not None and peek() not in "|)":
+            if peek() in "*+?":
+                raise Exception("Nothing to repeat at position " + str(pos) + " of " + regex)
+            tree = parse_atom()
+            while peek() is not None and peek() in "*+?":
+                tree = ({ "*" : "star", "+" : "plus", "?" : "opt" }[regex[pos]], tree)
+                pos += 1
+            items.append(tree)
+        if items == []:
+            return ("empty",)
+        return items[0] if len(items) == 1 else ("cat", items)
+
+    def parse_alt():
+        nonlocal pos
+        items = [parse_cat()]
+        while peek() == "|":
+            pos += 1
+            items.append(parse_cat())
+        return items[0] if len(items) == 1 else ("alt", items)
+
+    tree = parse_alt()
+    if pos != len(regex):
+        raise Exception("Unbalanced ) at position " + str(pos) + " of " + regex)
+    return tree
+
+def bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class GlushkovNFA:
+    '''
+    Position automaton of a list of regular expressions. State 0 is
+    initial and state p > 0 is the position p, reached by reading one
+    of the symbols chars[p]. follow[p] is the bitset of the states
+    that follow p (follow[0] is the set of the first positions),
+    sym_mask[s] is the bitset of the positions that read symbols[s],
+    final is the bitset of the final states and tag[p] is the number
+    of the first expression in which p is final. expr[p] is the number
+    of the expression of position p, and nullable is the bitset of the
+    expressions that accept the empty word.
+    '''
+    __slots__ = ("symbols", "chars", "follow", "sym_mask", "final", "tag", "expr", "nullable")
+
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.chars = [frozenset()]
+        self.follow = [0]
+        self.sym_mask = [0] * len(symbols)
+        self.final = 0
+        self.tag = [None]
+        self.expr = [None]
+        self.nullable = 0
+
+    def __len__(self):
+        return len(self.follow)
+
+    def add_position(self, chars, t):
+        p = len(self.follow)
+        self.chars.append(chars)
+        self.follow.append(0)
+        self.tag.append(None)
+        self.expr.append(t)
+        return p
+
+    def add_tree(self, tree, t):
+        '''
+        Adds the positions of tree, the syntax tree of the expression
+        number t. Returns whether it is nullable and the bitsets of its
+        first and last positions.
+        '''
+        kind = tree[0]
+        if kind == "empty":
+            return True, 0, 0
+        if kind == "sym":
+            p = self.add_position(tree[1], t)
+            return False, 1 << p, 1 << p
+        if kind == "alt":
+            nullable, first, last = False, 0, 0
+            for x in tree[1]:
+                n, f, l = self.add_tree(x, t)
+                nullable, first, last = nullable or n, first | f, last | l
+            return nullable, first, last
+        if kind == "cat":
+            nullable, first, last = True, 0, 0
+            for x in tree[1]:
+                n, f, l = self.add_tree(x, t)
+                for p in bits(last):
+                    self.follow[p] |= f
+                if nullable:
+                    first |= f
+                last = l | last if n else l
+                nullable = nullable and n
+            return nullable, first, last
+        n, f, l = self.add_tree(tree[1], t)
+        if kind in ("star", "plus"):
+            for p in bits(l):
+                self.follow[p] |= f
+        return n or kind in ("star", "opt"), f, l
+
+def glushkov(regexes, sigma=None):
+    '''
+    Builds the GlushkovNFA of the union of regexes. Its alphabet is
+    sigma or, by default, the symbols that occur in regexes.
+    '''
+    trees = [parse_regex(r, sigma) for r in regexes]
+    if sigma is None:
+        symbols = set()
+        work = trees.copy()
+        while work:
+            tree = work.pop()
+            if tree[0] == "sym":
+                symbols |= tree[1]
+            elif tree[0] in ("cat", "alt"):
+                work.extend(tree[1])
+            elif tree[0] != "empty":
+                work.append(tree[1])
+    else:
+        symbols = set(sigma)
+    nfa = GlushkovNFA(sorted(symbols))
+    for t, tree in enumerate(trees):
+        nullable, first, last = nfa.add_tree(tree, t)
+        nfa.follow[0] |= first
+        if nullable:
+            last |= 1
+            nfa.nullable |= 1 << t
+        for p in bits(last & ~nfa.final):
+            nfa.tag[p] = t
+        nfa.final |= last
+    index = { s : i for i, s in enumerate(nfa.symbols) }
+    for p in range(1, len(nfa)):
+        for c in nfa.chars[p]:
+            if c in index:
+                nfa.sym_mask[index[c]] |= 1 << p
+    return nfa
+
+def subset_construction(initial, moves, tag_of):
+    '''
+    Determinizes an automaton whose sets of states are bitsets, from
+    the set initial. moves(S) is the list of the sets reached from S by
+    each symbol and tag_of(S) is the tag of S, or -1 if it is not
+    final. Sets of states are numbered in the order in which they are
+    found, from initial, numbered 0; the empty set, if reached, is the
+    sink state.
+    Returns the row-major transition table and the tag of each state.
+    '''
+    index = { initial : 0 }
+    sets = [initial]
+    table = array("i")
+    tags = []
+    i = 0
+    while i < len(sets):
+        s = sets[i]
+        tags.append(tag_of(s))
+        for t in moves(s):
+            j = index.get(t)
+            if j is None:
+                j = len(sets)
+                index[t] = j
+                sets.append(t)
+            table.append(j)
+        i += 1
+    return table, tags
+
+def glushkov_moves(nfa):
+    follow = nfa.follow
+    sym_mask = nfa.sym_mask
+
+    def moves(s):
+        reach = 0
+        for p in bits(s):
+            reach |= follow[p]
+        return [reach & m for m in sym_mask]
+    return moves
+
+def glushkov_tag(nfa):
+    final = nfa.final
+    tag = nfa.tag
+
+    def tag_of(s):
+        return min((tag[p] for p in bits(s & final)), default=-1)
+    return tag_of
+
+def reversed_glushkov_moves(nfa):
+    # In the reversed automaton, the edges into position q, which read
+    # the symbols of q, leave q. Its states are the positions p > 0
+    # and, for each expression t, the state len(nfa) + t, which stands
+    # for the initial state 0 reached from the positions of t.
+    n = len(nfa)
+    pred = [0] * n
+    for p in range(n):
+        for q in bits(nfa.follow[p]):
+            pred[q] |= 1 << (n + nfa.expr[q] if p == 0 else p)
+    sym_mask = nfa.sym_mask
+
+    def moves(s):
+        result = []
+        for m in sym_mask:
+            reach = 0
+            for q in bits(s & m):
+                reach |= pred[q]
+            result.append(reach)
+        return result
+    return moves
+
+def reversed_dfa_moves(table, k, m):
+    # The states of the reversed automaton are the pairs (i, t) of a
+    # state i and an expression t, the bit i * m + t of a set. spread[s]
+    # [j] is the set of the pairs (i, 0) such that i reaches j by s.
+    n = len(table) // k
+    spread = [[0] * n for _ in range(k)]
+    for i in range(n):
+        for s in range(k):
+            spread[s][table[i * k + s]] |= 1 << (i * m)
+
+    def moves(s):
+        result = []
+        for ps in spread:
+            reach = 0
+            for b in bits(s):
+                j, t = divmod(b, m)
+                reach |= ps[j] << t
+            result.append(reach)
+        return result
+    return moves
+
+def initial_tag(m):
+    # The tag of a set of pairs is the least expression t paired with
+    # state 0, the initial state of the reversed automaton.
+    def tag_of(s):
+        s &= (1 << m) - 1
+        return (s & -s).bit_length() - 1
+    return tag_of
+
+def renumber(table, k, tags, class_of, n_classes):
+    '''
+    Builds the quotient of a transition table under the given classes,
+    numbering the classes in the order of their first states, so that
+    the class of state 0 is 0.
+    '''
+    number = [-1] * n_classes
+    first = []
+    for i, c in enumerate(class_of):
+        if number[c] == -1:
+            number[c] = len(first)
+            first.append(i)
+    new_table = array("i", [0] * (n_classes * k))
+    for c, i in enumerate(first):
+        for s in range(k):
+            new_table[c * k + s] = number[class_of[table[i * k + s]]]
+    return new_table, [tags[i] for i in first]
+
+def nfa_to_dfa(nfa, minimize="hopcroft"):
+    '''
+    Builds the DFA of a GlushkovNFA, whose initial state is state 0 of
+    the result. minimize is "hopcroft", to minimize it keeping apart
+    the states of different tags, "brzozowski", to build it by double
+    reversal, or None. With several expressions, the double reversal
+    yields the minimal DFA that tells apart the words by the set of
+    expressions they lead to, which is then minimized by Hopcroft's
+    algorithm on the tags; the DFA of the expressions themselves is
+    never built.
+    Returns a CompactDFA whose states are "q0", "q1", ... and the tag
+    of each state, or -1 if it is not final.
+    '''
+    k = len(nfa.symbols)
+    # The number of expressions.
+    m = max([t + 1 for t in nfa.expr[1:]] + [nfa.nullable.bit_length(), 1])
+    if minimize == "brzozowski":
+        # The determinized reversal, whose states are sets of positions
+        # and of the initial states of the expressions, is tagged by
+        # the bitset of the expressions whose initial state it holds.
+        # It is reversed and determinized again, from the pairs of its
+        # states and of the expressions of their tags.
+        n = len(nfa)
+        rev_table, rev_tags = subset_construction(nfa.final & ~1 | nfa.nullable << n,
+                                                  reversed_glushkov_moves(nfa),
+                                                  lambda s: s >> n)
+        start = 0
+        for i, ts in enumerate(rev_tags):
+            for t in bits(ts):
+                start |= 1 << (i * m + t)
+        table, tags = subset_construction(start, reversed_dfa_moves(rev_table, k, m),
+                                          initial_tag(m))
+    else:
+        table, tags = subset_construction(1, glushkov_moves(nfa), glushkov_tag(nfa))
+    n = len(tags)
+    cdfa = CompactDFA(["q" + str(i) for i in range(n)], list(nfa.symbols), table,
+                      bytearray(1 if t != -1 else 0 for t in tags))
+    if minimize == "hopcroft" or minimize == "brzozowski" and m > 1:
+        class_of, n_classes = hopcroft_classes(cdfa, tags)
+        table, tags = renumber(table, k, tags, class_of, n_classes)
+        cdfa = CompactDFA(["q" + str(i) for i in range(n_classes)], list(nfa.symbols), table,
+                          bytearray(1 if t != -1 else 0 for t in tags))
+    elif minimize not in ("brzozowski", None):
+        raise Exception("Unknown minimization method " + str(minimize))
+    return cdfa, tags
+
+def regex_to_dfa(regex, sigma=None, minimize="hopcroft"):
+    '''
+    Builds the minimal DFA of regex in the dictionary format of min.py.
+    Returns sigma, delta, the initial state "q0" and the list of final
+    states.
+    '''
+    cdfa, _ = nfa_to_dfa(glushkov([regex], sigma), minimize)
+    sigma, delta, final = compact_to_dfa(cdfa)
+    return sigma, delta, "q0", final
+
+def lexer_dfa(regexes, sigma=None, minimize="hopcroft"):
+    '''
+    Builds the minimal DFA of a lexer with one token per expression in
+    regexes, minimized as in nfa_to_dfa. Returns a CompactDFA and, for
+    each of its states, the number of the first expression that it
+    accepts, or -1.
+    '''
+    return nfa_to_dfa(glushkov(regexes, sigma), minimize)
+
+if __name__ == "__main__":
+    pp = pprint.PrettyPrinter()
+    print("Minimal DFA of (a|b)*abb")
+    sigma, delta, initial, final = regex_to_dfa("(a|b)*abb")
+    pp.pprint(delta)
+    print("Final states:", final)
+    print("Same DFA by Brzozowski's algorithm")
+    sigma, delta, initial, final = regex_to_dfa("(a|b)*abb", minimize="brzozowski")
+    pp.pprint(delta)
+    print("Final states:", final)
+    print("Lexer for if, identifiers and numbers")
+    cdfa, tags = lexer_dfa(["if", "[a-z][a-z0-9]*", "[0-9]+"])
+    print(len(cdfa), "states, tags:", tags)
+    print("Same lexer by Brzozowski's algorithm")
+    cdfa, tags = lexer_dfa(["if", "[a-z][a-z0-9]*", "[0-9]+"], minimize="brzozowski")
+    print(len(cdfa), "states, tags:", tags)
@@ -0,0 +1,317 @@
+# Parsing with context-free grammars.
+
+# The productions of a grammar are represented as a dictionary where
+# each item is a set of RHS productions with the same LHS, as in
+# cfg_simp and greibach: the key is the LHS and the value is a list,
+# whose elements are each RHS of the given LHS in the production set.
+# The empty RHS is ["epsilon"]. Symbols that are not keys of the
+# dictionary are terminals.
+
+# This module builds (i) the PDA that accepts the language of a
+# grammar, to be run by the simulator in pda.py, and (ii) an Earley
+# parser that recognizes words in polynomial time and builds a shared
+# packed parse forest (SPPF) of all their derivations.
+
+import os
+import sys
+import pprint
+from pda import accepts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "grammar"))
+from grammar import Grammar, make_grammar
+
+def cfg_to_pda(p, s):
+    '''
+    Builds the PDA that simulates leftmost derivations of the grammar
+    with productions p and start symbol s. From "q0" it pushes s and
+    moves to "q", where a variable on top of the stack is replaced by
+    one of its RHS and a terminal on top of the stack is matched with
+    the input. Since a transition pushes a single symbol, a RHS is
+    pushed by a chain of intermediate states. The PDA accepts in "qf"
+    with the input consumed and the stack empty.
+    Returns the transition dictionary, the initial state and the set
+    of final states.
+    '''
+    t_dict = { "q0" : [("epsilon", "epsilon", s, "q")], "q" : [] }
+    terminals = []
+    for a in p:
+        for i, alpha in enumerate(p[a]):
+            if alpha == ["epsilon"]:
+                t_dict["q"].append(("epsilon", a, "epsilon", "q"))
+                continue
+            # Pushes alpha from its last to its first symbol.
+            src, pop = "q", a
+            for k, x in enumerate(reversed(alpha)):
+                dst = "q" if k == len(alpha) - 1 else "q_" + a + "_" + str(i) + "_" + str(k + 1)
+                t_dict.setdefault(src, []).append(("epsilon", pop, x, dst))
+                src, pop = dst, "epsilon"
+            for x in alpha:
+                if x not in p and x not in terminals:
+                    terminals.append(x)
+    for x in terminals:
+        t_dict["q"].append((x, x, "epsilon", "q"))
+    t_dict["q"].append(("?", "?", "epsilon", "qf"))
+    return t_dict, "q0", {"qf"}
+
+# Earley parser
+
+def nullable_vars(rules):
+    '''
+    Computes the set of variables that derive the empty word.
+    '''
+    nullable = set()
+    # Each rule counts its symbols that are not known to be nullable.
+    count = [len(rhs) for _, rhs in rules]
+    uses = {}
+    for r, (_, rhs) in enumerate(rules):
+        for x in rhs:
+            uses.setdefault(x, []).append(r)
+    nullable.update(a for a, rhs in rules if rhs == ())
+    work = list(nullable)
+    while work:
+        x = work.pop()
+        for r in uses.get(x, ()):
+            count[r] -= 1
+            a = rules[r][0]
+            if count[r] == 0 and a not in nullable:
+                nullable.add(a)
+                work.append(a)
+    return nullable
+
+def grammar_rules(g):
+    '''
+    Lists the productions of the Grammar g as pairs (lhs, rhs tuple) of
+    symbol numbers, and indexes them by LHS.
+    '''
+    rules = [(g.lhs[r], g.rule_rhs(r)) for r in range(len(g.lhs))]
+    by_lhs = { a : g.rules_of(a) for a in g.variables() }
+    return rules, by_lhs
+
+class ParseForest:
+    '''
+    Shared packed parse forest of the derivations of tokens. Symbol
+    nodes are ("S", X, i, j), for X deriving tokens[i:j], and
+    intermediate nodes are ("I", r, dot, i, j), for the first dot
+    symbols of the RHS of rule r deriving tokens[i:j]. Symbols and
+    tokens are numbered as in the Grammar, whose symbol names are in
+    symbols. The families of a node are computed on demand from the
+    Earley chart.
+    '''
+    __slots__ = ("symbols", "rules", "by_lhs", "tokens", "chart", "completed", "root", "memo")
+
+    def __init__(self, symbols, rules, by_lhs, tokens, chart, completed, root):
+        self.symbols = symbols
+        self.rules = rules
+        self.by_lhs = by_lhs
+        self.tokens = tokens
+        self.chart = chart
+        self.completed = completed
+        self.root = root
+        self.memo = {}
+
+    def families(self, node):
+        '''
+        Returns the list of the families of node. A family of a symbol
+        node is a tuple with one intermediate node, or the empty tuple
+        for an empty RHS. A family of an intermediate node is a pair
+        (left, right) of an intermediate node, or None, and a symbol
+        node.
+        '''
+        if node in self.memo:
+            return self.memo[node]
+        fams = []
+        if node[0] == "S":
+            _, x, i, j = node
+            for r in self.by_lhs.get(x, ()):
+                n = len(self.rules[r][1])
+                if n == 0:
+                    if i == j:
+                        fams.append(())
+                elif (r, n, i) in self.chart[j]:
+                    fams.append((("I", r, n, i, j),))
+        else:
+            _, r, dot, i, j = node
+            x = self.rules[r][1][dot - 1]
+            if x in self.by_lhs:
+                splits = sorted(self.completed[j].get(x, ()))
+            elif j > 0 and self.tokens[j - 1] == x:
+                splits = [j - 1]
+            else:
+                splits = []
+            for k in splits:
+                if k >= i and (r, dot - 1, i) in self.chart[k]:
+                    left = ("I", r, dot - 1, i, k) if dot > 1 else None
+                    fams.append((left, ("S", x, k, j)))
+        self.memo[node] = fams
+        return fams
+
+    def sequences(self, node):
+        '''
+        Yields, for each derivation step of the symbol node, the tuple
+        of the symbol nodes of its children, in the order of the
+        families of node and of its intermediate nodes.
+        '''
+        for fam in self.families(node):
+            if fam == ():
+                yield ()
+                continue
+            stack = [(fam[0], ())]
+            while stack:
+                cur, suffix = stack.pop()
+                if cur is None:
+                    yield suffix
+                    continue
+                for left, right in reversed(self.families(cur)):
+                    stack.append((left, (right,) + suffix))
+
+    def tree(self, node=None):
+        '''
+        Extracts one parse tree of node (by default, the root) as nested
+        pairs (variable, children), where terminals are leaves. The
+        children of a node are chosen among its derivation steps whose
+        variable nodes are not on the path from the root, backtracking
+        when a child has no such step, so that the tree is finite.
+        '''
+        node = self.root if node is None else node
+        # Subtrees already built are finite, and valid anywhere.
+        done = {}
+        on_path = {node}
+        # A frame holds a node, its remaining derivation steps, the
+        # current step and the subtrees of its children built so far.
+        frames = [[node, self.sequences(node), None, []]]
+        failed = False
+        while frames:
+            frame = frames[-1]
+            current, steps, children, built = frame
+            if failed or children is None:
+                failed = False
+                children = next((seq for seq in steps
+                                 if not any(x in on_path for x in seq)), None)
+                if children is None:
+                    frames.pop()
+                    on_path.discard(current)
+                    failed = True
+                    continue
+                frame[2] = children
+                built = frame[3] = []
+            if len(built) < len(children):
+                child = children[len(built)]
+                if child[1] not in self.by_lhs:
+                    built.append(self.symbols[child[1]])
+                elif child in done:
+                    built.append(done[child])
+                else:
+                    on_path.add(child)
+                    frames.append([child, self.sequences(child), None, []])
+                continue
+            frames.pop()
+            on_path.discard(current)
+            done[current] = (self.symbols[current[1]], built)
+            if frames:
+                frames[-1][3].append(done[current])
+        if node not in done:
+            raise Exception("Cyclic derivation of " + str(node))
+        return done[node]
+
+def earley_chart(g, s, tokens):
+    '''
+    Runs Earley's algorithm for the Grammar g and start symbol s on
+    the list of terminals tokens, all given by their numbers in g
+    (-1 for terminals that are not in g). Items are triples
+    (rule, dot, origin); predictions over nullable variables also
+    advance the dot, as proposed by Aycock and Horspool.
+    Returns the rules, their index by LHS, the chart (one set of items
+    per position) and, per position j, the origins i of each variable
+    X completed over tokens[i:j].
+    '''
+    rules, by_lhs = grammar_rules(g)
+    nullable = nullable_vars(rules)
+    n = len(tokens)
+    chart = [set() for _ in range(n + 1)]
+    completed = [{} for _ in range(n + 1)]
+    # waiting[j] maps X to the items of chart[j] with the dot before X.
+    waiting = [{} for _ in range(n + 1)]
+    start = [(r, 0, 0) for r in by_lhs.get(s, ())]
+    chart[0].update(start)
+    agenda = start
+    for j in range(n + 1):
+        items = chart[j]
+        predicted = set()
+        next_agenda = []
+        while agenda:
+            r, dot, origin = agenda.pop()
+            rhs = rules[r][1]
+            new = []
+            if dot < len(rhs):
+                x = rhs[dot]
+                if x in by_lhs:
+                    waiting[j].setdefault(x, []).append((r, dot, origin))
+                    if x not in predicted:
+                        predicted.add(x)
+                        new.extend((r1, 0, j) for r1 in by_lhs[x])
+                    if x in nullable:
+                        new.append((r, dot + 1, origin))
+                elif j < n and tokens[j] == x:
+                    item = (r, dot + 1, origin)
+                    if item not in chart[j + 1]:
+                        chart[j + 1].add(item)
+                        next_agenda.append(item)
+            else:
+                a = rules[r][0]
+                origins = completed[j].setdefault(a, set())
+                if origin not in origins:
+                    origins.add(origin)
+                    new.extend((r1, dot1 + 1, origin1)
+                               for r1, dot1, origin1 in waiting[origin].get(a, ()))
+            for item in new:
+                if item not in items:
+                    items.add(item)
+                    agenda.append(item)
+        agenda = next_agenda
+    return rules, by_lhs, chart, completed
+
+def earley_parse(p, s, tokens):
+    '''
+    Parses tokens with the grammar with productions p and start symbol
+    s. p is a production dictionary or, to parse many words with the
+    same grammar, a Grammar built once by make_grammar.
+    Returns the ParseForest of its derivations, or None if tokens is
+    not in the language of the grammar.
+    '''
+    g = p if isinstance(p, Grammar) else make_grammar(p)
+    s_id = g.index.get(s, -1)
+    token_ids = [g.index.get(x, -1) for x in tokens]
+    rules, by_lhs, chart, completed = earley_chart(g, s_id, token_ids)
+    if 0 not in completed[len(tokens)].get(s_id, ()):
+        return None
+    return ParseForest(g.symbols, rules, by_lhs, token_ids, chart, completed,
+                       ("S", s_id, 0, len(tokens)))
+
+def earley_recognize(p, s, tokens):
+    return earley_parse(p, s, tokens) is not None
+
+if __name__ == "__main__":
+    pp = pprint.PrettyPrinter()
+    print("Grammar for {a^nb^n}")
+    p1 = { "S" : [["a", "S", "b"], ["epsilon"]] }
+    t_dict, q0, final = cfg_to_pda(p1, "S")
+    pp.pprint(t_dict)
+    for w in ["aabb", "aab"]:
+        print(w, "PDA:", accepts(w, q0, final, t_dict), "Earley:", earley_recognize(p1, "S", list(w)))
+    pp.pprint(earley_parse(p1, "S", list("aabb")).tree())
+    print()
+    print("Grammar of arithmetic expressions")
+    p2 = { "E" : [["E", "+", "T"], ["T"]],
+           "T" : [["T", "*", "F"], ["F"]],
+           "F" : [["(", "E", ")"], ["n"]] }
+    w = "n+n*(n+n)"
+    pp.pprint(earley_parse(p2, "E", list(w)).tree())
+    print("PDA:", accepts(w, "q0", {"qf"}, cfg_to_pda(p2, "E")[0], max_stack_depth=2 * len(w) + 2))
+    print()
+    print("Grammars with cycles of derivations")
+    cyclic = [({ "S" : [["S"], ["a"]] }, "a"),
+              ({ "S" : [["A"]], "A" : [["S"], ["a"]] }, "a"),
+              ({ "S" : [["A", "b"]], "A" : [["B"], ["epsilon"]], "B" : [["A"]] }, "b"),
+              ({ "S" : [["S", "S"], ["a"], ["epsilon"]] }, "aa")]
+    for p, w in cyclic:
+        print(p, w)
+        pp.pprint(earley_parse(p, "S", list(w)).tree())
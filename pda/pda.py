@@ -4,6 +4,11 @@
 # This module implements a pushdown automaton simulator.
 
 import pprint 
+import sys
+import time
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 def delta(w, stack, rhs):
     '''
@@ -61,7 +66,50 @@ def delta(w, stack, rhs):
     # target state with stack_prime.
     return w_prime, q_prime, stack_prime
 
-def delta_clos(w, q, stack, t_dict):
+def print_observer(w, q, stack, rhs, w_prime, q_prime, stack_prime):
+    '''
+    Observer that prints each applied transition.
+    '''
+    print(w, q, stack)
+    print("==["+str(rhs)+"]==>")
+    print(w_prime, q_prime, stack_prime)
+    print()
+
+class StepLog:
+    '''
+    Observer that keeps the last size applied transitions in a ring
+    buffer, as tuples (w, q, stack, rhs, w_prime, q_prime, stack_prime).
+    '''
+    __slots__ = ("steps",)
+
+    def __init__(self, size=1000):
+        self.steps = deque(maxlen=size)
+
+    def __call__(self, *step):
+        self.steps.append(step)
+
+class PDAStats:
+    '''
+    Counters of a simulation: configurations explored, maximum
+    frontier size, maximum stack depth and the time spent on each
+    level (a single entry for the whole search in accepts).
+    '''
+    __slots__ = ("configurations", "max_frontier", "max_stack_depth", "level_times")
+
+    def __init__(self):
+        self.configurations = 0
+        self.max_frontier = 0
+        self.max_stack_depth = 0
+        self.level_times = []
+
+    def __repr__(self):
+        return ("PDAStats(configurations=" + str(self.configurations) +
+                ", max_frontier=" + str(self.max_frontier) +
+                ", max_stack_depth=" + str(self.max_stack_depth) +
+                ", levels=" + str(len(self.level_times)) +
+                ", time=" + str(sum(self.level_times)) + ")")
+
+def delta_clos(w, q, stack, t_dict, observer=None):
     if q in t_dict.keys():
         w_prime = w[1:]
         q_prime = None
@@ -81,11 +129,9 @@ def delta_clos(w, q, stack, t_dict):
             else:
                 stack_guard = rhs[1] == "epsilon" or rhs[1] == "?"
             if sigma_guard and stack_guard:
-                print(w, q, stack)
-                print("==["+str(rhs)+"]==>")
                 w_prime, q_prime, stack_prime = delta(w, stack, rhs)
-                print(w_prime, q_prime, stack_prime)
-                print()
+                if observer is not None:
+                    observer(w, q, stack, rhs, w_prime, q_prime, stack_prime)
                 reachable.append((w_prime, q_prime, stack_prime))
         if reachable == []:
             return [(w, q, stack)]
@@ -94,37 +140,271 @@ def delta_clos(w, q, stack, t_dict):
     else:
         return [(w, q, stack)]
 
-def lifted_delta_clos(w_q_stack_list, t_dict):
+class CompiledPDA:
+    '''
+    Transition function of a PDA indexed once for simulation.
+    moves maps (q, input symbol or "epsilon", stack top or "epsilon")
+    to the list of (i, push, q_prime) of the applicable transitions,
+    where i is the position of the transition in t_dict[q].
+    final_moves maps q to the list of (i, q_prime) of its end-of-input
+    transitions ("?", "?", "epsilon", q_prime).
+    '''
+    __slots__ = ("moves", "final_moves")
+
+    def __init__(self, moves, final_moves):
+        self.moves = moves
+        self.final_moves = final_moves
+
+def intern(x):
+    return sys.intern(x) if type(x) is str else x
+
+def compile_pda(t_dict):
+    '''
+    Indexes the transitions of t_dict by state, input symbol and stack
+    top, interning the symbols that are strings.
+    '''
+    moves = {}
+    final_moves = {}
+    for q, rhs_list in t_dict.items():
+        q = intern(q)
+        for i, rhs in enumerate(rhs_list):
+            a, top, push, q_prime = (intern(x) for x in rhs)
+            if a == "?":
+                if top == "?" and push == "epsilon":
+                    final_moves.setdefault(q, []).append((i, q_prime))
+            elif top != "?":
+                moves.setdefault((q, a, top), []).append((i, push, q_prime))
+    return CompiledPDA(moves, final_moves)
+
+def compiled_end_clos(w, q, stack, c, observer=None):
+    '''
+    Applies the end-of-input transitions of the compiled PDA c.
+    '''
+    if len(w) == 0 and len(stack) == 0 and q in c.final_moves:
+        reachable = []
+        for _, q_prime in c.final_moves[q]:
+            if observer is not None:
+                observer(w, q, stack, ("?", "?", "epsilon", q_prime), w, q_prime, [])
+            reachable.append((w, q_prime, []))
+        return reachable
+    return [(w, q, stack)]
+
+def compiled_delta_clos(w, q, stack, c, observer=None):
+    '''
+    Same as delta_clos, but only looks up the transitions of the
+    compiled PDA c that apply to (w, q, stack).
+    '''
+    applied = []
+    keys_a = (w[0], "epsilon") if len(w) > 0 else ("epsilon",)
+    keys_top = (stack[-1], "epsilon") if len(stack) > 0 else ("epsilon",)
+    for a in keys_a:
+        for top in keys_top:
+            for i, push, q_prime in c.moves.get((q, a, top), ()):
+                w_prime = w if a == "epsilon" else w[1:]
+                stack_prime = stack.copy()
+                if top != "epsilon":
+                    stack_prime.pop()
+                if push != "epsilon":
+                    stack_prime.append(push)
+                applied.append((i, (a, top, push, q_prime), (w_prime, q_prime, stack_prime)))
+    if len(w) == 0 and len(stack) == 0 and q in c.final_moves:
+        for i, q_prime in c.final_moves[q]:
+            applied.append((i, ("?", "?", "epsilon", q_prime), (w, q_prime, [])))
+    if applied == []:
+        return [(w, q, stack)]
+    # Transitions are applied, and observed, in the order of t_dict[q].
+    applied.sort(key=lambda x: x[0])
+    if observer is not None:
+        for _, rhs, config in applied:
+            observer(w, q, stack, rhs, *config)
+    return [config for _, _, config in applied]
+
+def lifted_delta_clos(w_q_stack_list, t_dict, observer=None, stats=None):
+    '''
+    Computes the levels of configurations reachable from the ones in
+    w_q_stack_list. t_dict is either a transition dictionary or a
+    CompiledPDA, which is simulated without scanning transitions.
+    Each applied transition is passed to observer, if given, and
+    stats, if given, is a PDAStats updated at each level.
+    '''
+    if isinstance(t_dict, CompiledPDA):
+        step = lambda w, q, s: compiled_delta_clos(w, q, s, t_dict, observer)
+        final_step = lambda w, q, s: compiled_end_clos(w, q, s, t_dict, observer)
+    else:
+        t_final = {}
+        for k,v_list in t_dict.items():
+            for v in v_list:
+                if v[0] == "?" or v[1] == "?":
+                    if k not in t_final.keys():
+                        t_final.update({k : []})
+                    t_final[k].append(v)
+        step = lambda w, q, s: delta_clos(w, q, s, t_dict, observer)
+        final_step = lambda w, q, s: delta_clos(w, q, s, t_final, observer)
     levels = [w_q_stack_list.copy()]
     while True:
         levels_size = len(levels)
+        if stats is not None:
+            level_start = time.perf_counter()
+            stats.configurations += len(levels[-1])
+            stats.max_frontier = max(stats.max_frontier, len(levels[-1]))
+            for _, _, s in levels[-1]:
+                stats.max_stack_depth = max(stats.max_stack_depth, len(s))
         level = []
         # print(levels[-1])
         for w, q, s in levels[-1]:
-            w_q_stack_list_prime = delta_clos(w, q, s, t_dict)
+            w_q_stack_list_prime = step(w, q, s)
             if [(w, q, s)] != w_q_stack_list_prime:
                 level += w_q_stack_list_prime
         if len(level) > 0:
             levels.append(level)
         if len(w) == 0:
             level = []
-            t_final = {}
-            for k,v_list in t_dict.items():
-                for v in v_list:
-                    if v[0] == "?" or v[1] == "?":
-                        if k not in t_final.keys():
-                            t_final.update({k : []})
-                        t_final[k].append(v)
             for w, q, s in levels[-1]:
-                w_q_stack_list_prime = delta_clos(w, q, s, t_final)
+                w_q_stack_list_prime = final_step(w, q, s)
                 if [(w, q, s)] != w_q_stack_list_prime:
                     level += w_q_stack_list_prime
             if len(level) > 0:
                 levels.append(level)
+        if stats is not None:
+            stats.level_times.append(time.perf_counter() - level_start)
         new_levels_size = len(levels)
         if levels_size == new_levels_size:
             return levels
+
+class StackStore:
+    '''
+    Persistent stacks with structural sharing. A stack is an integer:
+    0 is the empty stack and every other stack is a node holding its
+    top symbol and the stack below it. Nodes are hash-consed, so equal
+    stacks are the same integer, and pushing or popping is O(1).
+    '''
+    __slots__ = ("top", "rest", "depth", "index")
+
+    def __init__(self):
+        self.top = [None]
+        self.rest = [0]
+        self.depth = [0]
+        self.index = {}
+
+    def push(self, sym, stack):
+        key = (sym, stack)
+        node = self.index.get(key)
+        if node is None:
+            node = len(self.top)
+            self.top.append(sym)
+            self.rest.append(stack)
+            self.depth.append(self.depth[stack] + 1)
+            self.index[key] = node
+        return node
+
+    def to_list(self, stack):
+        l = []
+        while stack != 0:
+            l.append(self.top[stack])
+            stack = self.rest[stack]
+        l.reverse()
+        return l
+
+def successors(w, pos, q, stack, c, store):
+    '''
+    Yields the configurations (pos, q, stack) reached in one step from
+    configuration (pos, q, stack) on input w in the compiled PDA c,
+    where pos indexes the remaining input and stack is a stack of
+    store.
+    '''
+    keys_a = (w[pos], "epsilon") if pos < len(w) else ("epsilon",)
+    keys_top = (store.top[stack], "epsilon") if stack != 0 else ("epsilon",)
+    for a in keys_a:
+        pos_prime = pos if a == "epsilon" else pos + 1
+        for top in keys_top:
+            for _, push, q_prime in c.moves.get((q, a, top), ()):
+                stack_prime = store.rest[stack] if top != "epsilon" else stack
+                if push != "epsilon":
+                    stack_prime = store.push(push, stack_prime)
+                yield pos_prime, q_prime, stack_prime
+    if pos == len(w) and stack == 0:
+        for _, q_prime in c.final_moves.get(q, ()):
+            yield pos, q_prime, stack
+
+def accepts(w, q0, final, t_dict, max_stack_depth=None, stats=None):
+    '''
+    Checks whether the PDA accepts w, that is, whether a configuration
+    with w consumed and a state in final is reachable from (w, q0, []).
+    Each configuration (input position, state, stack) is visited only
+    once, configurations whose stack is deeper than max_stack_depth
+    are pruned, and the search stops at the first accepting
+    configuration. t_dict is a transition dictionary or a CompiledPDA.
+    stats, if given, is a PDAStats updated by the search.
+    '''
+    c = t_dict if isinstance(t_dict, CompiledPDA) else compile_pda(t_dict)
+    store = StackStore()
+    start = (0, q0, 0)
+    visited = {start}
+    work = [start]
+    accepted = False
+    search_start = time.perf_counter()
+    while work:
+        pos, q, stack = work.pop()
+        if pos == len(w) and q in final:
+            accepted = True
+            break
+        for config in successors(w, pos, q, stack, c, store):
+            if max_stack_depth is not None and store.depth[config[2]] > max_stack_depth:
+                continue
+            if config not in visited:
+                visited.add(config)
+                work.append(config)
+        if stats is not None:
+            stats.max_frontier = max(stats.max_frontier, len(work))
+    if stats is not None:
+        stats.configurations += len(visited)
+        stats.max_stack_depth = max(stats.max_stack_depth,
+                                    max(store.depth[s] for _, _, s in visited))
+        stats.level_times.append(time.perf_counter() - search_start)
+    return accepted
     
+# Batch acceptance. Worker processes receive the compiled PDA once, in
+# their initializer, and then only chunks of words.
+
+batch_args = None
+
+def init_batch_worker(c, q0, final, max_stack_depth):
+    global batch_args
+    batch_args = (c, q0, final, max_stack_depth)
+
+def accepts_chunk(words):
+    c, q0, final, max_stack_depth = batch_args
+    return [accepts(w, q0, final, c, max_stack_depth) for w in words]
+
+def accepts_many(words, q0, final, t_dict, max_stack_depth=None, workers=None, chunksize=1000):
+    '''
+    Checks the acceptance of every word of the iterable words, sharing
+    a single compiled transition table. Yields the pairs (w, accepted)
+    in the order of words. If workers is greater than 1, chunks of
+    chunksize words are checked in a pool of worker processes, keeping
+    at most two chunks per worker in flight, so memory does not grow
+    with the number of words.
+    '''
+    c = t_dict if isinstance(t_dict, CompiledPDA) else compile_pda(t_dict)
+    words = iter(words)
+    if workers is None or workers <= 1:
+        for w in words:
+            yield w, accepts(w, q0, final, c, max_stack_depth)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker,
+                             initargs=(c, q0, final, max_stack_depth)) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * workers:
+                chunk = list(itertools.islice(words, chunksize))
+                if chunk == []:
+                    break
+                pending.append((chunk, pool.submit(accepts_chunk, chunk)))
+            if len(pending) == 0:
+                return
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
+
 if __name__ == "__main__":
     pp = pprint.PrettyPrinter()
     print("PDA for {a^nb^n}")
@@ -136,7 +416,7 @@ if __name__ == "__main__":
     delta1 = { "q0" : [("a", "epsilon", "B", "q0"), ("b", "B", "epsilon", "q1"), ("?", "?", "epsilon", "qf")],
                "q1" : [("b", "B", "epsilon", "q1"), ("?", "?", "epsilon", "qf")] }
     w = "aabb"
-    pp.pprint(lifted_delta_clos([(w, "q0",[])], delta1))
+    pp.pprint(lifted_delta_clos([(w, "q0",[])], delta1, observer=print_observer))
     print()
     print("PDA for {ww^r}")
     Sigma = {"a", "b"}
@@ -150,5 +430,5 @@ if __name__ == "__main__":
                        ("?", "?", "epsilon", "qf")] }
     M = (Sigma, Q, delta1, q0, F, V)
     w = "abba"
-    pp.pprint(lifted_delta_clos([(w, "q0", [])], delta1))
+    pp.pprint(lifted_delta_clos([(w, "q0", [])], delta1, observer=print_observer))
     